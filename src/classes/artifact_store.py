@@ -0,0 +1,149 @@
+import hashlib
+import os
+import threading
+
+from collections.abc import Iterator
+
+from classes.pypi_client import PyPIClient
+
+ARTIFACT_STORE_DIR: str = "./cache/artifacts" # path of the directory containing the downloaded distribution files
+
+class ArtifactStore:
+    """
+    Persistent local store of the distribution files (wheels and sdists) downloaded from PyPI, keyed by
+    (name, version, filename), so that reruns of the analyses read the artifacts at disk speed and can run offline.
+
+    Each artifact is stored as <root>/<normalized name>/<version>/<filename>, next to a <filename>.sha256 file containing
+    the SHA-256 digest computed while storing it. The digest is checked against the one published by PyPI when the
+    artifact is stored, and against the content when it is read: a corrupted artifact is removed and treated as missing.
+    """
+    def __init__(self, client: PyPIClient, root: str=ARTIFACT_STORE_DIR) -> None:
+        """
+        :param client: PyPI client used to download the missing artifacts (in offline mode nothing is downloaded)
+        :param root: path to the directory of the store
+        """
+        self.__client: PyPIClient = client
+        self.__root: str = root
+
+    def get_client(self) -> PyPIClient:
+        return self.__client
+
+    def __get_artifact_path(self, name: str, version: str, filename: str) -> str:
+        # file names are taken from the metadata: only the base name is used, so a name can't escape the store
+        return os.path.join(self.__root, PyPIClient.normalize_name(name), os.path.basename(version), os.path.basename(filename))
+
+    @staticmethod
+    def __hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def get(self, name: str, version: str, filename: str, sha256: str | None=None) -> str | None:
+        """
+        Look up an artifact in the store, checking its integrity.
+
+        :param name: name of the package
+        :param version: version of the package
+        :param filename: name of the distribution file
+        :param sha256: expected SHA-256 hex digest (e.g., published by PyPI), None to check only the stored digest
+        :return: path of the artifact, None if the artifact is not stored (or it is corrupted)
+        """
+        path = self.__get_artifact_path(name, version, filename)
+
+        try:
+            with open(f"{path}.sha256") as f:
+                stored_digest = f.read().strip()
+
+            if (sha256 is None or stored_digest == sha256) and self.__hash_file(path) == stored_digest:
+                return path
+        except OSError:
+            return None
+
+        print(f"Corrupted artifact {path}, removing it")
+        self.remove(name, version, filename)
+
+        return None
+
+    def remove(self, name: str, version: str, filename: str) -> None:
+        path = self.__get_artifact_path(name, version, filename)
+
+        for file in (path, f"{path}.sha256"):
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+
+    def fetch(self, name: str, version: str, release_file: dict) -> str:
+        """
+        Get the path of an artifact, downloading it in the store if it is missing.
+
+        :param name: name of the package
+        :param version: version of the package
+        :param release_file: metadata of the distribution file (filename, url and digests), as listed in the releases
+        :return: path of the artifact
+        :raises: ConnectionError if the artifact is missing in offline mode, requests.RequestException if the download
+            fails, ValueError if the integrity check fails
+        """
+        sha256 = release_file.get("digests", {}).get("sha256")
+
+        if (path := self.get(name, version, release_file["filename"], sha256)) is not None:
+            return path
+
+        path = self.__get_artifact_path(name, version, release_file["filename"])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        try:
+            with open(tmp_path, "wb") as f:
+                self.__client.download(release_file["url"], f, sha256)
+
+            # the digest file is written first: an artifact without digest is never considered stored
+            digest = self.__hash_file(tmp_path)
+
+            with open(f"{tmp_path}.sha256", "w") as f:
+                f.write(digest)
+
+            os.replace(f"{tmp_path}.sha256", f"{path}.sha256")
+            os.replace(tmp_path, path)
+        finally:
+            for file in (tmp_path, f"{tmp_path}.sha256"):
+                if os.path.exists(file):
+                    os.remove(file)
+
+        return path
+
+    def iter_projects(self) -> Iterator[str]:
+        """
+        :return: iterator of the normalized names of the packages having at least a stored artifact
+        """
+        if not os.path.isdir(self.__root):
+            return
+
+        for name in sorted(os.listdir(self.__root)):
+            if os.path.isdir(os.path.join(self.__root, name)):
+                yield name
+
+    def iter_artifacts(self, name: str) -> Iterator[tuple[str, str, str]]:
+        """
+        :param name: name of the package
+        :return: iterator of (version, filename, SHA-256 digest) of the stored artifacts of the package
+        """
+        project_dir = os.path.join(self.__root, PyPIClient.normalize_name(name))
+
+        if not os.path.isdir(project_dir):
+            return
+
+        for version in sorted(os.listdir(project_dir)):
+            for filename in sorted(os.listdir(os.path.join(project_dir, version))):
+                if filename.endswith(".sha256") or filename.endswith(".tmp"):
+                    continue
+
+                try:
+                    with open(os.path.join(project_dir, version, f"{filename}.sha256")) as f:
+                        yield version, filename, f.read().strip()
+                except OSError:
+                    continue # partially stored artifact
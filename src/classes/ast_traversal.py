@@ -0,0 +1,268 @@
+import ast
+
+from collections.abc import Callable
+
+from classes.scope_segments import ScopeSegments
+
+class ScopeContext:
+    """
+    Scope context shared by the plugins during the AST traversal. Scopes are identified by integers assigned in visiting
+    order: the global scope is 0, then each node generating a local scope gets the next identifier.
+    """
+    def __init__(self) -> None:
+        self.__scope_stack: list[int] = [0] # global scope
+        self.__next_id: int = 1
+
+    def current_scope(self) -> int:
+        """
+        :return: identifier of the scope under visit
+        """
+        return self.__scope_stack[-1]
+
+    def parent_scope(self) -> int | None:
+        """
+        :return: identifier of the scope enclosing the one under visit, None for the global scope
+        """
+        return self.__scope_stack[-2] if len(self.__scope_stack) > 1 else None
+
+    def open_scope(self) -> int:
+        """
+        Open a new local scope, nested in the current one.
+
+        :return: identifier of the new scope
+        """
+        scope = self.__next_id
+
+        self.__next_id += 1
+        self.__scope_stack.append(scope)
+
+        return scope
+
+    def close_scope(self) -> None:
+        self.__scope_stack.pop()
+
+    def get_next_scope(self) -> int:
+        """
+        :return: identifier the next local scope will get
+        """
+        return self.__next_id
+
+    def skip_scopes(self, scopes_number: int) -> None:
+        """
+        Reserve the identifiers of scopes not generated by the traversal (e.g., imported from a segment, see
+        TraversalPlugin.import_segment).
+
+        :param scopes_number: number of scopes
+        """
+        self.__next_id += scopes_number
+
+class TraversalPlugin:
+    """
+    Base class of the components (scope graph builder, AST heuristics, ...) sharing a single AST traversal.
+    A plugin registers a callback for each node type it is interested in and can be notified when a local scope is
+    opened or closed.
+    """
+    def get_callbacks(self) -> dict[type, Callable[[ast.AST, ScopeContext], None]]:
+        """
+        :return: dictionary node type -> callback. The callback is called when the node is entered (before its children)
+        and in the context of the scope enclosing the node, even for the nodes generating a local scope.
+        """
+        return {}
+
+    def enter_scope(self, node: ast.AST, context: ScopeContext) -> None:
+        """
+        Called after the local scope generated by node has been opened, before visiting the node's children.
+        """
+        pass
+
+    def exit_scope(self, node: ast.AST, context: ScopeContext) -> None:
+        """
+        Called after the node's children have been visited, before closing the local scope generated by node.
+        """
+        pass
+
+    def finish(self, context: ScopeContext) -> None:
+        """
+        Called once the whole AST has been visited.
+        """
+        pass
+
+    # Segments: a top-level statement of the module can be visited once and then replayed in the next versions of the
+    # file, as long as its lines don't change (see ScopeSegments). The plugins taking part in such a traversal export what
+    # they recorded while visiting the statement and import it in place of the visit. If a plugin of the traversal
+    # doesn't override these methods, the whole AST is visited.
+
+    def get_mark(self) -> object:
+        """
+        :return: position of the plugin state, passed to export_segment once the statement has been visited
+        """
+        raise NotImplementedError(f"{type(self).__name__} doesn't support segments")
+
+    def export_segment(self, mark: object, first_scope: int) -> object:
+        """
+        :param mark: position of the plugin state before visiting the statement (see get_mark)
+        :param first_scope: identifier of the first scope generated by the statement
+        :return: what the plugin recorded while visiting the statement
+        """
+        raise NotImplementedError(f"{type(self).__name__} doesn't support segments")
+
+    def import_segment(self, segment: object, line_offset: int, first_scope: int, context: ScopeContext) -> None:
+        """
+        Record a statement as if it were visited.
+
+        :param segment: what the plugin recorded while visiting the statement (see export_segment)
+        :param line_offset: offset to add to the line numbers of the segment (the statement has moved in the file)
+        :param first_scope: identifier of the first scope generated by the statement
+        :param context: scope context of the traversal (under visit: the global scope)
+        """
+        raise NotImplementedError(f"{type(self).__name__} doesn't support segments")
+
+class ASTTraversal:
+    """
+    Traversal engine that visits the AST once, dispatching each node to the callbacks registered by the plugins and
+    keeping track of the scopes. Adding a plugin costs only its callbacks, not another walk of the AST.
+
+    The following classes generate local scope:
+        * FunctionDef;
+        * Lambda;
+        * ClassDef;
+        * ListComp;
+        * ExceptHandler;
+        * AsyncFunctionDef
+    """
+    SCOPE_NODES: frozenset[type] = frozenset({ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef, ast.ListComp, ast.ExceptHandler})
+
+    def __init__(self, plugins: list[TraversalPlugin]) -> None:
+        self.__plugins: list[TraversalPlugin] = plugins
+        self.__context: ScopeContext = ScopeContext()
+        self.__callbacks: dict[type, list[Callable[[ast.AST, ScopeContext], None]]] = {}
+
+        for plugin in plugins:
+            for node_type, callback in plugin.get_callbacks().items():
+                self.__callbacks.setdefault(node_type, []).append(callback)
+
+        # nodes without fields (contexts and operators) that no plugin is interested in are not pushed on the stack
+        self.__skipped: frozenset[type] = frozenset(node_type for base in (ast.expr_context, ast.boolop, ast.operator, ast.unaryop, ast.cmpop)
+                                                    for node_type in base.__subclasses__() if node_type not in self.__callbacks)
+        # segments can be used only if every plugin can export and import them
+        self.__segments_supported: bool = all(getattr(type(plugin), method) is not getattr(TraversalPlugin, method)
+                                              for plugin in plugins for method in ("get_mark", "export_segment", "import_segment"))
+
+    def run(self, tree: ast.AST, segments: ScopeSegments | None=None) -> None:
+        """
+        Visit the AST and notify the plugins at the end of the traversal.
+
+        :param tree: AST to visit
+        :param segments: top-level statements of the previous version of the module: the statements whose lines haven't
+                         changed are replayed instead of visited, and the segments are updated to the visited module. If
+                         None, or if a plugin doesn't support segments, the whole AST is visited (and the segments are
+                         reset).
+        """
+        if segments is not None and isinstance(tree, ast.Module) and self.__segments_supported:
+            self.__visit_segments(tree, segments)
+        else:
+            if segments is not None:
+                segments.reset() # the segments don't follow the visited AST
+
+            self.__visit(tree)
+
+        for plugin in self.__plugins:
+            plugin.finish(self.__context)
+
+    def __visit_segments(self, tree: ast.Module, segments: ScopeSegments) -> None:
+        """
+        Visit the module one top-level statement at a time (the module node has no callbacks), replaying the statements
+        that are still in the segments. The plugins record the same state of a complete visit.
+
+        :param tree: AST of the module
+        :param segments: segments of the previous version of the module
+        """
+        context = self.__context
+        visited = {} # span of the statement -> (number of scopes, segments of the plugins, line offset)
+
+        for stmt in tree.body:
+            span = segments.get_span(stmt)
+            first_scope = context.get_next_scope()
+
+            if (reused := segments.get(span)) is not None:
+                scopes_number, plugin_segments, line_offset = reused
+
+                for plugin, segment in zip(self.__plugins, plugin_segments):
+                    plugin.import_segment(segment, line_offset, first_scope, context)
+
+                context.skip_scopes(scopes_number)
+            else:
+                marks = [plugin.get_mark() for plugin in self.__plugins]
+
+                self.__visit(stmt)
+
+                scopes_number, line_offset = context.get_next_scope() - first_scope, 0
+                plugin_segments = [plugin.export_segment(mark, first_scope) for plugin, mark in zip(self.__plugins, marks)]
+
+            # statements sharing their lines (e.g., a; b) can't be told apart by the span, so they are always visited
+            visited[span] = None if span in visited else (scopes_number, plugin_segments, line_offset)
+
+        segments.update(visited)
+
+    def __visit(self, tree: ast.AST) -> None:
+        """
+        Pre-order visit of the AST with an explicit stack, so the depth of the AST is not bounded by the recursion limit.
+        The nodes are dispatched with a lookup on their type.
+
+        :param tree: AST to visit
+        """
+        callbacks = self.__callbacks
+        scope_nodes = self.SCOPE_NODES
+        context = self.__context
+        skipped = self.__skipped
+        stack: list[ast.AST | _ScopeExit] = [tree]
+
+        while stack:
+            node = stack.pop()
+
+            if type(node) is _ScopeExit:
+                for plugin in self.__plugins:
+                    plugin.exit_scope(node.node, context)
+
+                context.close_scope()
+                continue
+
+            node_type = type(node)
+
+            if node_type in callbacks:
+                for callback in callbacks[node_type]:
+                    callback(node, context)
+
+            if node_type in scope_nodes:
+                context.open_scope()
+
+                for plugin in self.__plugins:
+                    plugin.enter_scope(node, context)
+
+                # the scope is closed once all the children have been visited
+                stack.append(_ScopeExit(node))
+
+            # children are pushed in reverse order, so they are visited in the order of the fields
+            children = []
+
+            for field in node._fields:
+                value = getattr(node, field, None)
+
+                if isinstance(value, list):
+                    for item in value:
+                        if isinstance(item, ast.AST) and type(item) not in skipped:
+                            children.append(item)
+                elif isinstance(value, ast.AST) and type(value) not in skipped:
+                    children.append(value)
+
+            children.reverse()
+            stack.extend(children)
+
+class _ScopeExit:
+    """
+    Marker pushed on the traversal stack to close the scope generated by a node.
+    """
+    __slots__ = ("node",)
+
+    def __init__(self, node: ast.AST) -> None:
+        self.node: ast.AST = node
@@ -1,13 +1,16 @@
-import itertools
 import ast
 import re
-import tokenize
 
-import numpy as np
+from collections.abc import Iterator
 
+from classes.ast_traversal import ASTTraversal, TraversalPlugin
 from classes.scope_graphv2 import ScopeGraph
 from classes.result import Result
 from classes.heuristic_engine import HeuristicEngine
+from classes.parsed_source import ParsedSource
+from classes.scope_segments import ScopeSegments
+
+DETECTOR_VERSION: str = "2.0" # version of the detection, bump it when a change affects the results (invalidates cached results)
 
 class Detector:
     """
@@ -17,7 +20,8 @@ class Detector:
         * function and method shadowing;
         * import shadowing.
     """
-    def __init__(self, code_path: str, scope_graph_name: str="", use_yara: bool=True, heuristic_path: str="./heuristics") -> None:
+    def __init__(self, code_path: str, scope_graph_name: str="", use_yara: bool=True, heuristic_path: str="./heuristics", source: ParsedSource|None=None,
+                 segments: ScopeSegments|None=None) -> None:
         """
         Construct the detector based on the scope graph built from a code and YARA rules to cover some evasion techniques.
 
@@ -25,63 +29,81 @@ class Detector:
         :param scope_graph_name: name of the scope graph to save. If the string is empty, we don't save the graph and ignore the argument.
         :parem use_yara: if True, we apply YARA rules
         :param heuristic_path: path to the directory containing YARA rules. If use_yara is False, this argument is ignored.
+        :param source: already read source of the code. If None, the source is read from code_path.
+        :param segments: top-level statements of the previous version of the code, to visit only the statements that have
+                         changed (see ScopeSegments). They are updated to this version. If None, the whole AST is visited.
         """
         if use_yara:
             self.__heuristic_dir = heuristic_path
 
-        # Use tokenize.open to respect PEP 263 encoding declaration and handle non-UTF-8 files robustly.
         self.__code_path: str = code_path
         self.__use_yara: bool = use_yara
 
-        try:
-            with tokenize.open(code_path) as f:
-                code = f.read()
-        except (SyntaxError, UnicodeDecodeError, LookupError):
-            # Fallback: attempt to read with UTF-8 and replace undecodable bytes.
-            # This keeps the pipeline running; files with severe encoding issues may still fail to parse.
-            with open(code_path, "r", encoding="utf-8", errors="replace") as f:
-                code = f.read()
+        # the file is read, decoded and parsed once, then the source is shared with the heuristic engine
+        self.__source: ParsedSource = source if source is not None else ParsedSource.from_path(code_path)
+        self.__error: Exception | None = None # why the scope graph couldn't be built
+
+        # the scope graph and the AST heuristics share a single traversal of the AST
+        self.__builder: ScopeGraph|None = ScopeGraph()
+        plugins: list[TraversalPlugin] = [self.__builder]
+
+        # YARA engine initialization
+        if self.__use_yara:
+            self.__heuristic_engine = HeuristicEngine(self.__source, self.__builder, heuristic_path)
+            plugins.extend(self.__heuristic_engine.get_traversal_plugins())
 
         # creating AST
         try:
-            tree = ast.parse(code)
+            tree = self.__source.get_tree()
 
             # building scope graph
-            self.__builder: ScopeGraph|None = ScopeGraph()
-            self.__builder.visit(tree)
+            ASTTraversal(plugins).run(tree, segments)
 
             if not scope_graph_name == "":
                 self.__builder.draw(scope_graph_name)
         except Exception as e:
+            if segments is not None:
+                segments.reset() # the next version can't be compared with this one
+
+            # the memory budget of the process is exhausted: it isn't a parse error, the caller has to know (see ScanWorker)
+            if isinstance(e, MemoryError):
+                raise
+
             print(f"Error parsing the code: {e}")
             self.__builder = None
-
-        # YARA engine initialization
-        if self.__use_yara and self.__builder is not None:
-            self.__heuristic_engine = HeuristicEngine(code_path, self.__builder, heuristic_path)
+            self.__error = e
 
     def get_builder(self) -> ScopeGraph|None:
         return self.__builder
 
-    def __is_local_scope(self, scope: str) -> bool:
+    def get_source(self) -> ParsedSource:
+        return self.__source
+
+    def get_error(self) -> Exception | None:
+        """
+        :return: error that prevented building the scope graph (e.g., a SyntaxError), None if the graph has been built
+        """
+        return self.__error
+
+    def __is_local_scope(self, scope: int) -> bool:
         """
         A scope is local if it has a parent.
 
-        :param scope: scope's name
+        :param scope: scope's identifier
         :return: True if the scope is local, False otherwise
         """
 
-        return self.__builder.get_graph()[scope]["parent"] is not None
+        return self.__builder.get_parent(scope) is not None
 
-    def __is_global_scope(self, scope: str) -> bool:
+    def __is_global_scope(self, scope: int) -> bool:
         """
         A scope is global if it has no parent.
 
-        :param scope: scope's name
+        :param scope: scope's identifier
         :return: True if the scope is global, False otherwise
         """
 
-        return self.__builder.get_graph()[scope]["parent"] is None
+        return self.__builder.get_parent(scope) is None
 
     def classify_scope(self, decl_var: str) -> None:
         """
@@ -97,73 +119,97 @@ class Detector:
 
         for scope in lst_scopes:
             if self.__is_local_scope(scope):
-                print(f"Variable {decl_var} is declared in local scope ({scope})")
+                print(f"Variable {decl_var} is declared in local scope ({self.__builder.get_scope_name(scope)})")
             elif self.__is_global_scope(scope):
-                print(f"Variable {decl_var} is declared in global scope ({scope})")
+                print(f"Variable {decl_var} is declared in global scope ({self.__builder.get_scope_name(scope)})")
 
     def shadowing_detection(self) -> tuple[list, list]:
         """
         Detect the presence of shadowing in the program.
-        Shadowing is where a variable or function is redeclared in a subscope, so to check it is necessary to walk up
-        the scope graph up to the global scope.
+        Shadowing is where a variable or function is redeclared in a subscope, so to check it is necessary to compare
+        each scope with all its ancestors up to the global scope.
 
         ALGORITHM:
-            * start from a scope with any child, we called 'leaf'
-            * check if during the walk up in the scope graph, check if the scope has a declaration of the same name.
-            Working with sets, it is enough to check if there is some intersection between the scope's declaration and the scopes' declaration.
+            * visit the scope graph top-down, starting from the global scope, carrying a map symbol -> stack of the
+            ancestor scopes declaring (referencing) that name;
+            * when a scope declares (references) a symbol that is already in the map, the symbol is shadowed with respect to
+            each ancestor in the stack: we emit one result for each (scope, ancestor) pair, so every pair is compared once.
         After checking the presence of shadowing, we apply YARA rules to cover some possible evasion techniques
 
         :return: tuple contains two lists: shadowed elements and YARA matches
         """
-        def detector(combinations: list) -> list:
+        def group_by_symbol(elems: Iterator[tuple[int, int]]) -> dict[int, list[int]]:
+            """
+            Group the (symbol, line) pairs of a scope by symbol.
+
+            :return: dictionary symbol -> sorted lines
             """
-            Performs the actual shadowing detection.
+            grouped = {}
+
+            for symbol, line in elems:
+                grouped.setdefault(symbol, set()).add(line)
+
+            return {symbol: sorted(lines) for symbol, lines in grouped.items()}
+
+        def detector(scope_elems: dict[int, list[int]], ancestors: dict[int, list[list[int]]]) -> list:
+            """
+            Performs the actual shadowing detection of a scope against its ancestors.
 
             :return: list of shadowed elements
             """
             output = []
 
-            for comb in combinations:
-                name_0 = [name[0] for name in comb[0]]
-                name_1 = [name[0] for name in comb[1]]
+            for symbol, lines in scope_elems.items():
+                for ancestor_lines in ancestors.get(symbol, []):
+                    output.append(Result(name=symbols.format(symbol), lines=lines + ancestor_lines))
+
+            return output
 
-                line_0 = [line[1] for line in comb[0]]
-                line_1 = [line[1] for line in comb[1]]
+        symbols = self.__builder.get_symbols()
+        children = [[] for _ in range(self.__builder.get_scopes_number())]
 
-                if len(intersections := set(name_0) & set(name_1)) > 0:  # & operator performs the intersection between sets
-                    for e in intersections:
-                        idxs = []
+        for scope in range(1, self.__builder.get_scopes_number()):
+            children[self.__builder.get_parent(scope)].append(scope)
 
-                        idxs.extend([line_0[idx] for idx in list(np.where(np.array(name_0) == e)[0])])
-                        idxs.extend([line_1[idx] for idx in list(np.where(np.array(name_1) == e)[0])])
+        decls_duplication = []
+        refs_duplication = []
+        ancestors_decls: dict[int, list[list[int]]] = {}
+        ancestors_refs: dict[int, list[list[int]]] = {}
+        # explicit stack of (scope, grouped decls, grouped refs): grouped elements are None while the scope has still to be visited
+        stack = [(0, None, None)] # starts from the global scope
 
-                        output.append(Result(name=e, lines=idxs))
+        while stack:
+            scope, decls, refs = stack.pop()
 
-            return output
+            if decls is not None:
+                # all the subtree has been visited, so the scope is no longer an ancestor
+                for ancestors, elems in ((ancestors_decls, decls), (ancestors_refs, refs)):
+                    for symbol in elems.keys():
+                        ancestors[symbol].pop()
 
-        leafs_scopes = self.__builder.get_leaf_scopes()
-        duplication = []
-        yara_results = []
+                        if len(ancestors[symbol]) == 0:
+                            del ancestors[symbol]
+                continue
 
-        for leaf in leafs_scopes:
-            scope = leaf
-            decls = []
-            refs = []
+            decls = group_by_symbol(self.__builder.iter_decls(scope))
+            refs = group_by_symbol(self.__builder.iter_refs(scope))
 
-            while scope is not None:
-                decls.append(self.__builder.get_graph()[scope]["decls"])
-                refs.append(self.__builder.get_graph()[scope]["refs"])
+            decls_duplication.extend(detector(decls, ancestors_decls))
+            refs_duplication.extend(detector(refs, ancestors_refs))
 
-                scope = self.__builder.get_graph()[scope]["parent"]
+            for ancestors, elems in ((ancestors_decls, decls), (ancestors_refs, refs)):
+                for symbol, lines in elems.items():
+                    ancestors.setdefault(symbol, []).append(lines)
 
-            decls_combinations = list(itertools.combinations(decls, 2))
-            refs_combinations = list(itertools.combinations(refs, 2))
+            stack.append((scope, decls, refs))
+            stack.extend((child, None, None) for child in reversed(children[scope]))
 
-            duplication.extend(self.__filter_vars(detector(decls_combinations)))
-            duplication.extend(detector(refs_combinations))
+        duplication = self.__filter_vars(decls_duplication)
+        duplication.extend(refs_duplication)
+
+        # YARA rule application (once per file)
+        yara_results = self.__heuristic_engine.rule_apply() if self.__use_yara else []
 
-            # YARA rule application
-            yara_results = self.__heuristic_engine.rule_apply()
         return duplication, yara_results
 
     def __filter_vars(self, lst: list) -> list:
@@ -195,7 +241,7 @@ class Detector:
         )
         var_values = self.__builder.get_variables_values()
 
-        for elem in lst:
+        for elem in list(lst): # iterate over a copy, elements are removed from lst
             if "var_" not in elem.get_name():
                 continue
 
@@ -214,70 +260,44 @@ class Detector:
 
     def local_import_detection(self) -> list[str]:
         """
-        This detector aims to detect the presence of local imports. To do so, we check if a scope has references to
-        import statements assigned a prefix "import_" to the element added to the scope graph.
+        This detector aims to detect the presence of local imports. To do so, we check the local scopes having references
+        to import statements, given by the import index of the scope graph.
 
         :return: list of scopes with local imports
         """
-        scope_with_local_imports = []
-        import_regex = re.compile("^import_")
-
-        for scope in self.__builder.get_graph().keys():
-            matches = [import_regex.match(ref) for ref in self.__builder.get_graph()[scope]["refs"]]
-
-            if not scope == "s0__main__" and len(matches) > 0 and not all(match is None for match in matches):
-                scope_with_local_imports.append(scope)
-
-        return scope_with_local_imports
-
-    def __check_inner_functions(self, scopes_chain: list) -> list|None:
-        regex_func = re.compile("(^s\\d+_(func|afunc)_.*)")
-        re_matches = [regex_func.match(scope) for scope in scopes_chain ]
-
-        return re_matches if not all(re_match is None for re_match in re_matches) else None
+        # the global scope (0) is skipped
+        return [self.__builder.get_scope_name(scope) for scope in self.__builder.get_import_scopes() if not scope == 0]
 
     def inner_function_detection(self) -> tuple[list, int]:
         """
         This detector aims to detect the presence of inner functions. To do so, we check if there are two local scopes defined by functions.
-        The best way is to do so by walking up to the global scope from the leaf scopes (scopes with no children).
+        We consider the chains from the leaf scopes (scopes with no children) to the global scope: depth and number of
+        function scopes of each chain are recorded while building the scope graph, so only the chains containing inner
+        functions are walked (jumping directly from a function scope to the enclosing one).
 
-        :return: list contains the chain of inner functions. The element in a list is not None if the local scope has been generated by a function.
+        :return: list contains the chain of inner functions (scopes generated by a function) and the total number of
+                 scopes in the chains containing at least a function.
                  NOTE: the list is ordered from the innermost to the outermost scopes
         """
-        def match_filter(lst_matches: list) -> list:
-            """
-            This function removes the None elements from lists of matches and removes the lists with 2 elements with only one match.
-
-            :param lst_matches: list containing matches
-            :return: filtered list of matches
-            """
-            output = []
-
-            for matches in lst_matches:
-                if len(matches) == 2 and all(isinstance(match, re.Match) for match in matches):
-                    output.append([match.group() for match in matches])
-                elif len(matches) > 2:
-                    filtered_match = [match.group() for match in matches if match is not None]
-
-                    if len(filtered_match) >=2:
-                        output.append(filtered_match)
-            return output
-
-        leafs_scopes = self.__builder.get_leaf_scopes()
         inner_functions = []
         total_scopes = 0 # contains the total number of scopes take into account
 
-        for leaf in leafs_scopes:
-            scope = leaf
-            scopes_branch = []
+        for leaf in self.__builder.get_leaf_scopes():
+            chain_length = self.__builder.get_depth(leaf) # number of local scopes in the chain
+
+            if chain_length < 2 or (functions_number := self.__builder.get_function_depth(leaf)) == 0:
+                continue
+
+            total_scopes += chain_length
 
-            while not self.__is_global_scope(scope):
-                scopes_branch.append(scope)
-                scope = self.__builder.get_graph()[scope]["parent"]
+            if functions_number >= 2:
+                functions_chain = []
+                scope = self.__builder.get_enclosing_function(leaf)
 
-            if len(scopes_branch) >= 2 and (matches := self.__check_inner_functions(scopes_branch)) is not None:
-                inner_functions.append(matches)
+                while scope is not None:
+                    functions_chain.append(self.__builder.get_scope_name(scope))
+                    scope = self.__builder.get_enclosing_function(self.__builder.get_parent(scope))
 
-                total_scopes += len(scopes_branch)
+                inner_functions.append(functions_chain)
 
-        return match_filter(inner_functions), total_scopes
+        return inner_functions, total_scopes
@@ -1,21 +1,33 @@
-from subprocess import CompletedProcess
-
+from classes.git_cat_file import GitCatFile
 from classes.gitlog_parser import GitLogParser
-from classes.detectorv2 import Detector
 from classes.lhdiff import LHDiff
-
-import subprocess
+from classes.line_mapping_cache import LineMappingCache
+from classes.line_tracker import LineTracker
+from classes.result import Result
+from classes.result_cache import ResultCache
+from classes.scan_worker import scan_bytes
+from classes.scope_segments import ScopeSegments
+
+import contextlib
+import copy
+import io
 import os
 import json
+import tokenize
+
+from collections.abc import Iterator
 
-TEMP_FILE = "./tmp" # path of a temporary file containing the code to analyze
+TEMP_FILE = "./tmp" # path of the directory where the code of the commits is saved (see build)
+LINE_TRACKERS = {"lhdiff": LHDiff, "native": LineTracker} # line trackers available to follow the lines across commits
 
 class FileShadowingHistoty:
     """
     Class whose goal is to build the history of shadowing over time of a given file
     """
 
-    def __init__(self, git_log: str, file_path: str, heuristic_path: str) -> None:
+    def __init__(self, git_log: str, file_path: str, heuristic_path: str, result_cache: ResultCache | None = None,
+                 cat_file: GitCatFile | None = None, line_mapping_cache: LineMappingCache | None = None,
+                 line_tracker: str = "lhdiff", incremental: bool = False) -> None:
         """
         Parameters:
             :param git_log: str
@@ -24,44 +36,60 @@ class FileShadowingHistoty:
                 path of the file that we want to build the history
             :param heuristic_path: str
                 path containing the heuristics for the detector
+            :param result_cache: ResultCache
+                cache of the detector results, if None a cache in the default directory is used
+            :param cat_file: GitCatFile
+                git cat-file process of the repository (shared by the files of the repository), if None the file starts
+                its own
+            :param line_mapping_cache: LineMappingCache
+                persistent cache of the line mappings between versions (it must belong to the chosen line tracker), if None
+                the mappings are kept only in memory
+            :param line_tracker: str
+                line tracker following the lines across commits: "lhdiff" (external lhdiff tool) or "native" (in-process,
+                see LineTracker)
+            :param incremental: bool
+                if True, the versions are analyzed from the oldest to the newest and the detector visits only the top-level
+                statements touched by the diff of each commit, replaying the others from the previous version (see
+                ScopeSegments). The results are the same of a complete analysis.
         """
+        if line_tracker not in LINE_TRACKERS.keys():
+            raise ValueError(f"Unknown line tracker {line_tracker}, available: {', '.join(LINE_TRACKERS.keys())}")
+
         self.__git_log: GitLogParser = GitLogParser(git_log)
         self.__file_path: str = file_path
         self.__heuristic_path: str = heuristic_path
         self.__history: dict = {}
+        self.__result_cache: ResultCache = result_cache if result_cache is not None else ResultCache(heuristic_path)
+        self.__cat_file: GitCatFile | None = cat_file
+        self.__line_mapping_cache: LineMappingCache | None = line_mapping_cache
+        self.__line_tracker: LHDiff | LineTracker = LINE_TRACKERS[line_tracker]()
+        self.__line_mappings: list | None = None # line mappings between consecutive commits, computed once per file
+        self.__incremental: bool = incremental
+        self.__segments_version: tuple[str, str] | None = None # (blob id, encoding) of the version followed by the segments
         self.__memory: list = [] #list that works as memory to save the already seen results and to understand when the result doesn't still anymore within the results
 
     def get_history(self) -> dict:
         return self.__history
 
-    def __get_code_by_hash(self, commit_hash: str) -> CompletedProcess[str]:
+    def __get_code_by_hash(self, commit_hash: str) -> bytes:
         """
-        Retrieve the code content of a specific file at a given commit hash from a Git repository.
-
-        This method executes a Git command to fetch the contents of the file specified by
-        its path at the specific commit hash. The file path is inferred from the object's
-        internal state, omitting any private details. The command output includes the
-        desired file's content if successful.
+        Retrieve the code content of the file at a given commit hash, streamed by the git cat-file process of the
+        repository.
 
         Parameters:
             commit_hash:
                 A string representing the hash of the commit from which the file content should be retrieved.
 
         Returns:
-            CompletedProcess: A subprocess.CompletedProcess instance containing the captured
-                              output, with the file's content available in the `stdout` attribute.
+            bytes: content of the file at the commit.
+
+        :raises: FileNotFoundError
+            Raised if the file doesn't exist at the commit.
         """
-        return subprocess.run(
-            [
-                "git",
-                "-C", "/".join(self.__file_path.split("/")[:-1]),
-                "show",
-                f"{commit_hash}:./{self.__file_path.split('/')[-1]}"
-            ],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        if (code := self.__cat_file.get_file(commit_hash, self.__file_path)) is None:
+            raise FileNotFoundError(f"{self.__file_path} doesn't exist at {commit_hash}")
+
+        return code
 
     def __parse_result(self, results: list, commit_hash: str, res_type: str) -> None:
         for result in results:
@@ -73,8 +101,11 @@ class FileShadowingHistoty:
     def build(self, save_commits: bool= False):
         """
         Build the history of shadowing over time of a given file given its git-history
-            * retrieve the file version from the commit hash (git show <commit_hash>:<file>)
-            * detect shadowing
+            * retrieve the file version from the commit hash (git cat-file --batch, the content is analyzed in memory)
+            * detect shadowing, once for each distinct version of the file: commits leaving the file as a previous one
+            (e.g., reverts, merges, renames) share its blob id and get a copy of its result
+            * if incremental, the commits are visited from the oldest and each version is analyzed reusing the top-level
+            statements of the previous one that are untouched by the hunks of the commit
             * cycle over all the commits on the specific file
 
         Parameters:
@@ -93,56 +124,184 @@ class FileShadowingHistoty:
         if self.__git_log.gitlog_is_empty():
             return
 
-        for commit_hash in self.__git_log.get_commits_hashes():
-            if save_commits:
-                code_path = f"{TEMP_FILE}/code/{'-'.join(self.__file_path.split("/")[: -1])}/{self.__file_path.split("/")[-1].replace(".py", "")}/{commit_hash}.py"
-            else:
-                code_path = f"{TEMP_FILE}/code/commit.py"
+        self.__line_mappings = None # the commits of the history may change
 
-            # retrieves file version of the given file associated to hash
-            try:
-                code = self.__get_code_by_hash(commit_hash)
+        analyzed_blobs = {} # blob id of the file -> first commit whose version has been analyzed
+        commits = self.__git_log.get_commits_hashes()
+        segments = ScopeSegments() if self.__incremental else None
+        self.__segments_version = None
 
-                if not os.path.exists(code_path):
-                    os.makedirs(os.path.dirname(code_path), exist_ok=True)
+        with self.__open_cat_file():
+            for commit_hash in commits[::-1] if self.__incremental else commits:
+                blob_id = self.__cat_file.get_file_id(commit_hash, self.__file_path)
 
-                with open(code_path, "w") as f: # era aperto in append
-                    f.write(code.stdout)
-            except subprocess.CalledProcessError as e:
-                print(f"Git command failed: {e.stderr}")
+                if blob_id is None or blob_id not in analyzed_blobs.keys():
+                    self.__build_commit(commit_hash, save_commits, blob_id, segments)
 
-                self.__history[commit_hash] = {
-                    "author": self.__git_log.get_commit_author(commit_hash),
-                    "datetime": self.__git_log.get_commit_datetime(commit_hash),
-                    "shadowing": str(e),
-                    "shadowing_res": {},
-                    "yara": {}
-                }
-                continue
+                    if blob_id is not None:
+                        analyzed_blobs[blob_id] = commit_hash
+
+                    continue
 
-            # shadowing detection
-            try:
-                shadowing, yara = Detector(code_path, heuristic_path=self.__heuristic_path).shadowing_detection()
-            except Exception as e:
                 self.__history[commit_hash] = {
+                    **copy.deepcopy(self.__history[analyzed_blobs[blob_id]]),
                     "author": self.__git_log.get_commit_author(commit_hash),
-                    "datetime": self.__git_log.get_commit_datetime(commit_hash),
-                    "shadowing": str(e),
-                    "shadowing_res": {},
-                    "yara": {}
+                    "datetime": self.__git_log.get_commit_datetime(commit_hash)
                 }
-                continue
 
+                if save_commits:
+                    self.__save_code(commit_hash, self.__cat_file.get(blob_id))
+
+        # the history follows the order of the git log
+        self.__history = {commit_hash: self.__history[commit_hash] for commit_hash in commits}
+
+    @contextlib.contextmanager
+    def __open_cat_file(self) -> Iterator[None]:
+        """
+        Make sure a git cat-file process is available while the context is open: if no process was given to the
+        constructor, the file starts its own and stops it at the end.
+        """
+        if self.__cat_file is not None:
+            yield
+            return
+
+        self.__cat_file = GitCatFile(self.__file_path)
+
+        try:
+            yield
+        finally:
+            self.__cat_file.close()
+            self.__cat_file = None
+
+    def __save_code(self, commit_hash: str, code: bytes) -> str:
+        """
+        Save the code of the file at a commit.
+
+        Parameters:
+            :param commit_hash: str
+                hash of the commit
+            :param code: bytes
+                content of the file at the commit
+
+        :return: path of the saved file
+        """
+        code_path = f"{TEMP_FILE}/code/{'-'.join(self.__file_path.split("/")[: -1])}/{self.__file_path.split("/")[-1].replace(".py", "")}/{commit_hash}.py"
+
+        os.makedirs(os.path.dirname(code_path), exist_ok=True)
+
+        with open(code_path, "wb") as f:
+            f.write(code)
+
+        return code_path
+
+    @staticmethod
+    def __get_encoding(code: bytes) -> str | None:
+        """
+        :param code: content of the file
+        :return: encoding of the code (PEP 263), None if the code can't be analyzed incrementally (the line numbers of the
+        hunks are the ones of the AST only if no line ends with a lone carriage return)
+        """
+        if b"\r" in code.replace(b"\r\n", b""):
+            return None
+
+        try:
+            return tokenize.detect_encoding(io.BytesIO(code).readline)[0]
+        except SyntaxError:
+            return None
+
+    def __set_changes(self, commit_hash: str, blob_id: str | None, code: bytes, segments: ScopeSegments) -> tuple[str, str] | None:
+        """
+        Give the segments the hunks of a commit, if they lead from the version followed by the segments to the one of the
+        commit.
+
+        Parameters:
+            :param commit_hash: str
+                hash of the commit
+            :param blob_id: str
+                blob id of the file at the commit
+            :param code: bytes
+                content of the file at the commit
+            :param segments: ScopeSegments
+                segments of the last analyzed version
+
+        :return: (blob id, encoding) of the version of the commit, None if it can't be analyzed incrementally
+        """
+        hunks = self.__git_log.get_commit_hunks(commit_hash)
+        encoding = self.__get_encoding(code)
+
+        # the hunks lead from the first parent (merges have none): the encoding must not change either, since the
+        # unchanged lines must decode the same
+        if (encoding is not None and len(hunks) > 0 and self.__segments_version is not None
+                and self.__segments_version == (self.__cat_file.get_file_id(f"{commit_hash}^", self.__file_path), encoding)):
+            segments.set_changes(hunks)
+        else:
+            segments.set_changes(None)
+
+        return None if encoding is None or blob_id is None else (blob_id, encoding)
+
+    def __build_commit(self, commit_hash: str, save_commits: bool, blob_id: str | None = None, segments: ScopeSegments | None = None) -> None:
+        """
+        Detect shadowing in the version of the file of a commit.
+
+        Parameters:
+            :param commit_hash: str
+                hash of the commit
+            :param save_commits: bool
+                if True, the code of the file is saved (see build)
+            :param blob_id: str
+                blob id of the file at the commit
+            :param segments: ScopeSegments
+                segments of the last analyzed version, to analyze the version incrementally (see build). If None, the
+                version is completely analyzed.
+        """
+        # retrieves file version of the given file associated to hash
+        try:
+            code = self.__get_code_by_hash(commit_hash)
+
+            if save_commits:
+                code_path = self.__save_code(commit_hash, code)
+            else:
+                code_path = f"{self.__file_path}@{commit_hash}" # only for reporting
+        except OSError as e:
+            print(f"Git command failed: {e}")
+
+            self.__history[commit_hash] = {
+                "author": self.__git_log.get_commit_author(commit_hash),
+                "datetime": self.__git_log.get_commit_datetime(commit_hash),
+                "shadowing": str(e),
+                "shadowing_res": {},
+                "yara": {}
+            }
+            return
+
+        if segments is not None:
+            self.__segments_version = self.__set_changes(commit_hash, blob_id, code, segments)
+
+        # shadowing detection (a version already seen, even in another file, is not analyzed again)
+        try:
+            result = scan_bytes(code, code_path, self.__heuristic_path, self.__result_cache, segments)
+            shadowing = [Result.from_dict(elem) for elem in result["shadowing"]]
+            yara = [Result.from_dict(elem) for elem in result["yara"]]
+        except Exception as e:
             self.__history[commit_hash] = {
                 "author": self.__git_log.get_commit_author(commit_hash),
                 "datetime": self.__git_log.get_commit_datetime(commit_hash),
-                "shadowing": "true" if len(shadowing) > 0 or len(yara) > 0 else "false",
+                "shadowing": str(e),
                 "shadowing_res": {},
                 "yara": {}
             }
+            return
+
+        self.__history[commit_hash] = {
+            "author": self.__git_log.get_commit_author(commit_hash),
+            "datetime": self.__git_log.get_commit_datetime(commit_hash),
+            "shadowing": "true" if len(shadowing) > 0 or len(yara) > 0 else "false",
+            "shadowing_res": {},
+            "yara": {}
+        }
 
-            self.__parse_result(shadowing, commit_hash, "shadowing_res")
-            self.__parse_result(yara, commit_hash, "yara")
+        self.__parse_result(shadowing, commit_hash, "shadowing_res")
+        self.__parse_result(yara, commit_hash, "yara")
 
     def dump(self, save_dir: str = "./") -> None:
         """
@@ -157,6 +316,55 @@ class FileShadowingHistoty:
         """
         json.dump(self.__history, open(f"{save_dir}/{self.__file_path.split('/')[-1]}_shadowing_history.json", "w"), indent=4)
 
+    def __get_line_mappings(self) -> list:
+        """
+        Line mappings between each pair of consecutive commits of the history (from the oldest to the newest), computed
+        the first time they are requested. The mapping of a pair of versions is read from the persistent cache, if any,
+        and the line tracker runs only for the pairs never seen before.
+
+        :return: list whose i-th element is the mapping ([{left, right}]) between the i-th and the (i + 1)-th commit, None
+        if the mapping isn't available (e.g., the file doesn't exist at one of the commits or the line tracker fails)
+        """
+        if self.__line_mappings is not None:
+            return self.__line_mappings
+
+        commits = list(self.__history.keys())[::-1]
+        self.__line_mappings = []
+
+        with self.__open_cat_file():
+            right = self.__cat_file.get_file(commits[0], self.__file_path) if len(commits) > 0 else None
+
+            for i in range(len(commits) - 1):
+                left, right = right, self.__cat_file.get_file(commits[i + 1], self.__file_path)
+
+                if left is None or right is None:
+                    self.__line_mappings.append(None)
+                    continue
+
+                if left == right: # same version of the file (e.g., a merge or a rename): each line maps to itself
+                    lines = self.__decode(left).split("\n")
+
+                    self.__line_mappings.append([{"left": i + 1, "right": i + 1} for i in range(len(lines) - (lines[-1] == ""))])
+                    continue
+
+                if self.__line_mapping_cache is None or (mapping := self.__line_mapping_cache.get(left, right)) is None:
+                    mapping = self.__line_tracker.diff_contents(self.__decode(left), self.__decode(right), raw=False)
+
+                    if mapping is not None and self.__line_mapping_cache is not None:
+                        self.__line_mapping_cache.put(left, right, mapping)
+
+                self.__line_mappings.append(mapping)
+
+        return self.__line_mappings
+
+    @staticmethod
+    def __decode(code: bytes) -> str:
+        """
+        :param code: content of the file
+        :return: content decoded as git show does (universal newlines)
+        """
+        return io.TextIOWrapper(io.BytesIO(code), encoding="utf-8", errors="replace").read()
+
     def __get_lines_history(self, lines: list[int], res_name: str, data: dict, start_commit: str = None) -> dict:
         """
         Retrieves the history of specified lines in a file, tracking changes across
@@ -178,17 +386,13 @@ class FileShadowingHistoty:
             the line is deleted, or no further changes are found in subsequent commits.
         """
         commits = list(self.__history.keys())[::-1]
-        tracker = LHDiff()
-        tracker_res = []
 
         if data is not None:
             if res_name not in data.keys():
                 data[res_name] = []
 
-            for i in range(len(commits) - 1):
-                diff = tracker.diff("/".join(self.__file_path.split("/")[:-1]), commits[i], commits[i + 1], self.__file_path.split('/')[-1], raw=False)
-
-                tracker_res.append(diff)
+            # mappings are shared by all the tracked results, so the line tracker runs once for each pair of commits
+            tracker_res = self.__get_line_mappings()
 
             if len(tracker_res) > 0:
                 for line in lines:
@@ -0,0 +1,129 @@
+import os
+import subprocess
+import threading
+
+class GitCatFile:
+    """
+    Long-lived `git cat-file --batch` process of a repository: the content of a file at a given commit is streamed on
+    request through the pipes of the process, so retrieving thousands of versions of a file costs neither a git process
+    nor a temporary file for each of them. A second process (`git cat-file --batch-check`) resolves object ids without
+    reading the contents.
+    """
+    def __init__(self, path: str) -> None:
+        """
+        :param path: path to the repository, or to any file or directory inside it
+        """
+        directory = path if os.path.isdir(path) else os.path.dirname(path) or "."
+
+        self.__root: str = subprocess.run(["git", "-C", directory, "rev-parse", "--show-toplevel"],
+                                          capture_output=True, text=True, check=True).stdout.strip()
+        self.__processes: dict[str, subprocess.Popen] = {} # option (--batch, --batch-check) -> git process
+        self.__lock: threading.Lock = threading.Lock() # requests and responses must not interleave
+
+    def __enter__(self) -> "GitCatFile":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def get_root(self) -> str:
+        """
+        :return: path to the root of the repository
+        """
+        return self.__root
+
+    def __request(self, option: str, object_name: str) -> tuple[list[bytes], subprocess.Popen]:
+        """
+        Send a request to the git process of the given option (started if needed) and read the header of the response.
+        The caller must hold the lock.
+
+        :param option: option of git cat-file (--batch, --batch-check)
+        :param object_name: name of the object
+        :return: fields of the header ("<oid> <type> <size>" or "<name> missing") and git process
+        :raises: ValueError if the name contains a newline, OSError if the git process dies
+        """
+        if "\n" in object_name:
+            raise ValueError(f"Invalid object name: {object_name!r}")
+
+        if option not in self.__processes.keys() or self.__processes[option].poll() is not None:
+            self.__processes[option] = subprocess.Popen(["git", "-C", self.__root, "cat-file", option],
+                                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+        process = self.__processes[option]
+
+        process.stdin.write(f"{object_name}\n".encode())
+        process.stdin.flush()
+
+        if (header := process.stdout.readline()) == b"":
+            raise OSError(f"git cat-file stopped in {self.__root}")
+
+        return header.split(), process
+
+    def get(self, object_name: str) -> bytes | None:
+        """
+        :param object_name: name of the object, as accepted by git (e.g., <commit>:<path relative to the root>, <blob id>)
+        :return: content of the object, None if the object doesn't exist
+        :raises: ValueError if the name contains a newline, OSError if the git process dies
+        """
+        with self.__lock:
+            fields, process = self.__request("--batch", object_name)
+
+            if len(fields) < 3 or fields[-1] in (b"missing", b"ambiguous"):
+                return None
+
+            content = process.stdout.read(int(fields[-1]))
+            process.stdout.read(1) # newline terminating the content
+
+            return content
+
+    def get_object_id(self, object_name: str) -> str | None:
+        """
+        :param object_name: name of the object, as accepted by git (e.g., <commit>:<path relative to the root>)
+        :return: id of the object, None if the object doesn't exist
+        :raises: ValueError if the name contains a newline, OSError if the git process dies
+        """
+        with self.__lock:
+            fields, _ = self.__request("--batch-check", object_name)
+
+            if len(fields) < 3 or fields[-1] in (b"missing", b"ambiguous"):
+                return None
+
+            return fields[0].decode()
+
+    def __get_relative_path(self, file_path: str) -> str:
+        """
+        :param file_path: path of the file (in the working tree of the repository)
+        :return: path of the file relative to the root of the repository
+        """
+        # the directory is resolved (the root reported by git has no symlinks), the file is not: git tracks symlinks as such
+        directory, filename = os.path.split(file_path)
+
+        return os.path.relpath(os.path.join(os.path.realpath(directory or "."), filename), os.path.realpath(self.__root)).replace(os.sep, "/")
+
+    def get_file(self, commit_hash: str, file_path: str) -> bytes | None:
+        """
+        :param commit_hash: hash of the commit
+        :param file_path: path of the file (in the working tree of the repository)
+        :return: content of the file at the commit, None if the file doesn't exist at the commit
+        """
+        return self.get(f"{commit_hash}:{self.__get_relative_path(file_path)}")
+
+    def get_file_id(self, commit_hash: str, file_path: str) -> str | None:
+        """
+        :param commit_hash: hash of the commit
+        :param file_path: path of the file (in the working tree of the repository)
+        :return: blob id of the file at the commit (same id, same content), None if the file doesn't exist at the commit
+        """
+        return self.get_object_id(f"{commit_hash}:{self.__get_relative_path(file_path)}")
+
+    def close(self) -> None:
+        """
+        Stop the git processes.
+        """
+        with self.__lock:
+            for process in self.__processes.values():
+                process.stdin.close()
+                process.wait()
+                process.stdout.close()
+
+            self.__processes = {}
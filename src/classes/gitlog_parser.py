@@ -4,6 +4,9 @@ class GitLogParser:
     """
     Class that parse the git log command output into dictionary
     """
+    # header of a hunk of the patch: @@ -<old start>[,<old lines>] +<new start>[,<new lines>] @@
+    __HUNK_HEADER: re.Pattern = re.compile(r'^@@\s+-(\d+)(?:,(\d+))?\s+\+(\d+)(?:,(\d+))?\s+@@.*$', flags=re.MULTILINE)
+
     def __init__(self, gitlog: str=""):
         """
         Constructor
@@ -40,10 +43,60 @@ class GitLogParser:
                                   "mail": mail,
                                   "datetime": datetime,
                                   "description": description.group(1) if description is not None else "",
-                                  "diffs": diffs[1] if len(diffs) > 1 else ""}
+                                  "diffs": diffs[1] if len(diffs) > 1 else "",
+                                  "hunks": self.__parse_hunks(commit)}
 
         return commits_info
 
+    def __parse_hunks(self, commit: str) -> list[dict]:
+        """
+        Parse the hunks of the patch of a commit (git log -p), keeping the line numbers of each line of the hunks.
+
+        :param commit: log of the commit
+        :return: list of hunks, each one with the fields:
+            * old_start, old_lines, new_start, new_lines: ranges of the header;
+            * lines: (old line number, new line number) of each line of the hunk, old is None for an added line and new
+            is None for a removed line
+        """
+        # the patch follows the commit message, so a message quoting a hunk header is not taken into account
+        if (patch_start := commit.find("\ndiff --git")) < 0:
+            return []
+
+        patch = commit[patch_start:]
+        headers = list(self.__HUNK_HEADER.finditer(patch))
+        hunks = []
+
+        for idx, header in enumerate(headers):
+            old_start, old_lines, new_start, new_lines = header.groups()
+            hunk = {"old_start": int(old_start),
+                    "old_lines": 1 if old_lines is None else int(old_lines),
+                    "new_start": int(new_start),
+                    "new_lines": 1 if new_lines is None else int(new_lines),
+                    "lines": []}
+            old_line, new_line = hunk["old_start"], hunk["new_start"]
+            old_left, new_left = hunk["old_lines"], hunk["new_lines"]
+            body = patch[header.end() + 1: headers[idx + 1].start() if idx + 1 < len(headers) else len(patch)]
+
+            for line in body.split("\n"):
+                if old_left <= 0 and new_left <= 0:
+                    break
+
+                if line.startswith("-"):
+                    hunk["lines"].append((old_line, None))
+                    old_line, old_left = old_line + 1, old_left - 1
+                elif line.startswith("+"):
+                    hunk["lines"].append((None, new_line))
+                    new_line, new_left = new_line + 1, new_left - 1
+                elif line.startswith(" ") or line == "":
+                    hunk["lines"].append((old_line, new_line))
+                    old_line, old_left = old_line + 1, old_left - 1
+                    new_line, new_left = new_line + 1, new_left - 1
+                # "\ No newline at end of file" doesn't count as a line
+
+            hunks.append(hunk)
+
+        return hunks
+
     def get_commits_hashes(self) -> list:
         return list(self.__log.keys())
 
@@ -65,6 +118,13 @@ class GitLogParser:
     def get_commit_diffs(self, hash: str) -> str:
         return self.__log[hash]["diffs"]
 
+    def get_commit_hunks(self, hash: str) -> list[dict]:
+        """
+        :param hash: hash of the commit
+        :return: hunks of the patch of the commit (see __parse_hunks)
+        """
+        return self.__log[hash]["hunks"]
+
     def gitlog_is_empty(self) -> bool:
         """
         Check if the git log is empty
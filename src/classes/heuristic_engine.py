@@ -1,35 +1,124 @@
+import hashlib
 import yara
 import os
 
 from classes import result, scope_graph
+from classes.ast_traversal import TraversalPlugin
 from classes.heuristics import ASTHeuristics
+from classes.parsed_source import ParsedSource
 from classes.scope_graphv2 import ScopeGraph
 from classes.result import Result
 
+YARA_CACHE_DIR: str = "./cache/yara" # path of the directory containing the precompiled YARA rules
+
 class HeuristicEngine:
     """
     YARA engine + custom heuristic engine based on AST and scope graph
     """
+    # process-wide cache of the compiled rules: heuristic directory -> (directory signature, compiled rules)
+    __COMPILED_RULES: dict[str, tuple[tuple, yara.Rules]] = {}
+
+    @staticmethod
+    def __get_rule_files(heuristic_path: str) -> list[str]:
+        """
+        :param heuristic_path: path to the directory containing YARA rules
+        :return: sorted list of the rule files in the directory
+        """
+        return sorted(file for file in os.listdir(heuristic_path) if os.path.isfile(f"{heuristic_path}/{file}"))
+
+    @staticmethod
+    def get_rules_digest(heuristic_path: str="./heuristics") -> str:
+        """
+        Compute a hash of the rule directory contents (file names and contents), so that a change to any rule produces a
+        different digest.
+
+        :param heuristic_path: path to the directory containing YARA rules
+        :return: SHA-256 hex digest of the rule set
+        """
+        digest = hashlib.sha256()
+
+        for file in HeuristicEngine.__get_rule_files(heuristic_path):
+            with open(f"{heuristic_path}/{file}", "rb") as f:
+                content = f.read()
+
+            digest.update(f"{file}\0{len(content)}\0".encode())
+            digest.update(content)
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def __load_rules(heuristic_path: str) -> yara.Rules:
+        """
+        Load the rules from the on-disk cache of precompiled rules (keyed by the rules digest), compiling and saving them
+        if they are not cached yet.
+
+        :param heuristic_path: path to the directory containing YARA rules
+        :return: compiled rules
+        """
+        digest = HeuristicEngine.get_rules_digest(heuristic_path)
+        cache_path = f"{YARA_CACHE_DIR}/{digest}.yarc"
+
+        if os.path.exists(cache_path):
+            try:
+                return yara.load(cache_path)
+            except yara.Error:
+                pass # corrupted blob, compile again the rules
+
+        # every file is compiled in its own namespace, as when each file was compiled on its own
+        rules = yara.compile(filepaths={file: f"{heuristic_path}/{file}" for file in HeuristicEngine.__get_rule_files(heuristic_path)})
+
+        try:
+            os.makedirs(YARA_CACHE_DIR, exist_ok=True)
+
+            # write on a temporary file and rename it, so that concurrent processes never load a partial blob
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            rules.save(tmp_path)
+            os.replace(tmp_path, cache_path)
+        except (OSError, yara.Error) as e:
+            print(f"Unable to cache YARA rules: {e}")
+
+        return rules
+
     def __yara_engine_init(self, heuristic_path: str="./heuristics") -> None:
-        for file in os.listdir(heuristic_path):
-            self.__rules.append(yara.compile(f"{heuristic_path}/{file}"))
+        """
+        Retrieve the compiled rules. Rules are compiled once per process: the directory signature (names, sizes and
+        modification times of the rule files) is checked at each initialization, so editing a rule replaces the cached rules
+        of the directory.
+
+        :param heuristic_path: path to the directory containing YARA rules
+        """
+        signature = tuple((file, (stat := os.stat(f"{heuristic_path}/{file}")).st_size, stat.st_mtime_ns) for file in self.__get_rule_files(heuristic_path))
+        key = os.path.abspath(heuristic_path)
 
-    def __init__(self, code_path: str, scope_graph:ScopeGraph, heuristic_path: str="./heuristics") -> None:
-        self.__rules: list = []
-        self.__code_path = code_path
+        if key not in HeuristicEngine.__COMPILED_RULES or not HeuristicEngine.__COMPILED_RULES[key][0] == signature:
+            HeuristicEngine.__COMPILED_RULES[key] = (signature, self.__load_rules(heuristic_path))
+
+        self.__rules = HeuristicEngine.__COMPILED_RULES[key][1]
+
+    def __init__(self, source: ParsedSource, scope_graph:ScopeGraph, heuristic_path: str="./heuristics") -> None:
+        self.__rules: yara.Rules | None = None
+        self.__source: ParsedSource = source
 
         self.__yara_engine_init(heuristic_path)
-        # Custom heuristic engine initialization (AST and scope-graph based)
-        self.__ast_heuristics = ASTHeuristics(self.__code_path, scope_graph)
+        # Custom heuristic engine initialization (AST and scope-graph based), the heuristics are applied by the AST
+        # traversal building the scope graph
+        self.__ast_heuristics = ASTHeuristics(scope_graph)
+
+    def get_traversal_plugins(self) -> list[TraversalPlugin]:
+        """
+        :return: plugins to add to the AST traversal building the scope graph
+        """
+        return [self.__ast_heuristics]
 
     def __get_yara_matching_line(self, match) -> list[int]:
         """
         Extracts and returns the line numbers in the file where the provided YARA match patterns occur.
 
-        This method processes the code present in the file at the specified path and calculates
+        This method works on the in-memory content of the file (the same buffer given to YARA) and calculates
         the line numbers corresponding to the offsets of matched patterns provided by the YARA
-        library. It reads the file content, determines the offset of each matching instance,
-        and translates the offset into line numbers by counting newline characters.
+        library. It determines the offset of each matching instance, and translates the offset into
+        line numbers with a binary search on the newline offsets of the file, computed once and shared
+        by every rule and instance.
 
         Parameters:
             :param match (Match object):
@@ -38,24 +127,18 @@ class HeuristicEngine:
         :returns: list[int]:
             A list of integers representing the line numbers in the file where the matched patterns occur.
         """
-        with open(self.__code_path) as f:
-            code = f.read()
-
         lines = []
 
         for string in match.strings:
             for instance in string.instances:
-                offset = instance.offset
-
-                lines.append(code[:offset].count('\n') + 1)
+                lines.append(self.__source.get_line_number(instance.offset))
         return lines
 
     def rule_apply(self) -> list[Result]:
         results: list[Result] = self.__ast_heuristics.get_results()
 
         # YARA rule application
-        for rule in self.__rules:
-            for match in rule.match(self.__code_path):
-                results.append(Result(name=match.rule, lines=self.__get_yara_matching_line(match)))
+        for match in self.__rules.match(data=self.__source.get_raw()):
+            results.append(Result(name=match.rule, lines=self.__get_yara_matching_line(match)))
 
         return results
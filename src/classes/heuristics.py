@@ -1,11 +1,20 @@
 import ast
-import tokenize
 
-from classes.result import Result
-from classes.scope_graphv2 import ScopeGraph
+from collections.abc import Callable
 
-class ASTHeuristics(ast.NodeVisitor):
-    def __init__(self, code_path: str, scope_graph: ScopeGraph) -> None:
+from classes.ast_traversal import ScopeContext, TraversalPlugin
+from classes.result import Result
+from classes.scope_graphv2 import ScopeGraph, SymbolKind
+
+class ASTHeuristics(TraversalPlugin):
+    """
+    Custom heuristics based on AST and scope graph. The heuristics are callbacks of the AST traversal that builds the
+    scope graph, so they don't need another walk of the AST:
+        * with_statement -> With
+        * eval_call -> Assign
+        * exec_call -> Expr
+    """
+    def __init__(self, scope_graph: ScopeGraph) -> None:
         self.__FILTERED_FUNCTIONS: list[str] = ["open", "Lock", "RLock", "TemporaryFile", "NamedTemporaryFile",
                                                 "TemporaryDirectory", "closing", "suppress", "redirect_stdout", "redirect_stderr",
                                                 "ExitStack", "nullcontext", "urlopen", "connect", "Cursor", "Session", "scandir",
@@ -16,110 +25,75 @@ class ASTHeuristics(ast.NodeVisitor):
             "eval_call": [],
             "exec_call": []
         }
-        self.__scope_graph: dict = scope_graph.get_graph()
-        self.__scope_stack: list[str] = ["s0__main__"]
-        self.__next_id: int = 1
-
-        try:
-            with tokenize.open(code_path) as f:
-                code = f.read()
-        except (SyntaxError, UnicodeDecodeError, LookupError):
-            # Fallback: attempt to read with UTF-8 and replace undecodable bytes.
-            # This keeps the pipeline running; files with severe encoding issues may still fail to parse.
-            with open(code_path, "r", encoding="utf-8", errors="replace") as f:
-                code = f.read()
-
-        tree = ast.parse(code)
-
-        self.visit(tree)
+        self.__scope_graph: ScopeGraph = scope_graph
+        # with statements found during the traversal as (line, function name, scope): the function name is None if the
+        # statement is already a finding, otherwise we have to check if the function is defined in the scope, which is
+        # known only once the scope has been completely visited
+        self.__with_candidates: list[tuple[int, str | None, int]] = []
 
     def get_results(self) -> list[Result]:
         return [Result(name, lines) for name, lines in self.__results.items() if len(lines) > 0]
 
-    def __track_scope(self, node: ast.FunctionDef|ast.AsyncFunctionDef|ast.Lambda|ast.ClassDef|ast.ListComp|ast.ExceptHandler) -> None:
-        def get_scope_id(node: ast.FunctionDef | ast.AsyncFunctionDef | ast.Lambda | ast.ClassDef | ast.ListComp | ast.ExceptHandler) -> str:
-            if isinstance(node, ast.FunctionDef):
-                visit_type = "func"
-                sid = f"s{self.__next_id}_{visit_type}_{node.name}"
-            elif isinstance(node, ast.AsyncFunctionDef):
-                visit_type = "afunc"
-                sid = f"s{self.__next_id}_{visit_type}_{node.name}"
-            elif isinstance(node, ast.Lambda):
-                visit_type = "lambda"
-                sid = f"s{self.__next_id}_{visit_type}"
-            elif isinstance(node, ast.ClassDef):
-                visit_type = "class"
-                sid = f"s{self.__next_id}_{visit_type}_{node.name}"
-            elif isinstance(node, ast.ListComp):
-                visit_type = "lstComp"
-                sid = f"s{self.__next_id}_{visit_type}"
-            elif isinstance(node, ast.ExceptHandler):
-                visit_type = "excHandler"
-                sid = f"s{self.__next_id}_{visit_type}"
-
-            return sid
+    def get_callbacks(self) -> dict[type, Callable[[ast.AST, ScopeContext], None]]:
+        return {ast.With: self.__visit_with,
+                ast.Assign: self.__visit_assign,
+                ast.Expr: self.__visit_expr}
 
-        self.__scope_stack.append(get_scope_id(node))
-        self.__next_id += 1
+    def finish(self, context: ScopeContext) -> None:
+        for line, func_name, scope in self.__with_candidates:
+            if func_name is None or self.__is_builtin(func_name, scope):
+                self.__results["with_statement"].append(line)
 
-        self.generic_visit(node)
-        self.__scope_stack.pop()
+    def get_mark(self) -> tuple[int, dict[str, int]]:
+        return len(self.__with_candidates), {name: len(lines) for name, lines in self.__results.items()}
 
-    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
-        self.__track_scope(node)
+    def export_segment(self, mark: tuple[int, dict[str, int]], first_scope: int) -> tuple[int, list, dict[str, list[int]]]:
+        candidates_number, results_numbers = mark
 
-    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
-        self.__track_scope(node)
+        return first_scope, self.__with_candidates[candidates_number:], {name: lines[results_numbers[name]:] for name, lines in self.__results.items()}
 
-    def visit_Lambda(self, node: ast.Lambda) -> None:
-        self.__track_scope(node)
+    def import_segment(self, segment: tuple[int, list, dict[str, list[int]]], line_offset: int, first_scope: int, context: ScopeContext) -> None:
+        segment_first_scope, candidates, results = segment
+        scope_offset = first_scope - segment_first_scope
 
-    def visit_ClassDef(self, node: ast.ClassDef) -> None:
-        self.__track_scope(node)
+        self.__with_candidates.extend((line + line_offset, func_name, 0 if scope == 0 else scope + scope_offset) for line, func_name, scope in candidates)
 
-    def visit_ListComp(self, node: ast.ListComp)-> None:
-        self.__track_scope(node)
+        for name, lines in results.items():
+            self.__results[name].extend(line + line_offset for line in lines)
 
-    def visit_ExceptHandler(self, node: ast.ExceptHandler)-> None:
-        self.__track_scope(node)
-
-    def __is_builtin(self, target: str, scope:str) -> bool:
-        return any(f"func_{target}" in v for v in [decl[0] for decl in self.__scope_graph[scope]["decls"]]) or any(f"import_{target}" in v for v in [ref[0] for ref in self.__scope_graph[scope]["refs"]])
+    def __is_builtin(self, target: str, scope: int) -> bool:
+        # the function is (re)defined or imported in the scope
+        return (self.__scope_graph.is_declared(scope, SymbolKind.FUNC, target) or self.__scope_graph.is_declared(scope, SymbolKind.AFUNC, target)
+                or self.__scope_graph.is_referenced(scope, SymbolKind.IMPORT, target))
 
     # make detection of with statements 2 possible cases:
     # 1. function not in FILTERED_FUNCTIONS with at least >= 3 (needed for locally overwrite the target function, see PoC)
     # 2. function in FILTERED_FUNCTIONSn (all built-in), however, such a function is defined in the scope of the with statement
-    def visit_With(self, node: ast.With) -> None:
-        current_scope = self.__scope_stack[-1]
+    def __visit_with(self, node: ast.With, context: ScopeContext) -> None:
+        current_scope = context.current_scope()
 
         for item in node.items:
+            if not isinstance(item.context_expr, ast.Call): # e.g., with lock:
+                continue
+
             if isinstance(item.context_expr.func, ast.Name):
                 func_name = item.context_expr.func.id
-
-                if func_name not in self.__FILTERED_FUNCTIONS and len(item.context_expr.args) >= 3:
-                    self.__results["with_statement"].append(node.lineno)
-                elif func_name in self.__FILTERED_FUNCTIONS and self.__is_builtin(func_name, current_scope):
-                    self.__results["with_statement"].append(node.lineno)
-
             elif isinstance(item.context_expr.func, ast.Attribute):
                 func_name = item.context_expr.func.attr
+            else:
+                continue
 
-                if item.context_expr.func.attr not in self.__FILTERED_FUNCTIONS and len(item.context_expr.args) >= 3:
-                    self.__results["with_statement"].append(node.lineno)
-                elif item.context_expr.func.attr in self.__FILTERED_FUNCTIONS and self.__is_builtin(func_name, current_scope):
-                    self.__results["with_statement"].append(node.lineno)
-        self.generic_visit(node)
+            if func_name not in self.__FILTERED_FUNCTIONS and len(item.context_expr.args) >= 3:
+                self.__with_candidates.append((node.lineno, None, current_scope))
+            elif func_name in self.__FILTERED_FUNCTIONS:
+                self.__with_candidates.append((node.lineno, func_name, current_scope))
 
     # make detection of assignments that make a call of eval
-    def visit_Assign(self, node: ast.Assign) -> None:
+    def __visit_assign(self, node: ast.Assign, context: ScopeContext) -> None:
         if isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name) and node.value.func.id == "eval":
             self.__results["eval_call"].append(node.lineno)
 
-        self.generic_visit(node)
-
     # detect exec function calls
-    def visit_Expr(self, node: ast.Expr) -> None:
+    def __visit_expr(self, node: ast.Expr, context: ScopeContext) -> None:
         if isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name) and node.value.func.id == "exec":
             self.__results["exec_call"].append(node.lineno)
-
-        self.generic_visit(node)
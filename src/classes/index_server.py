@@ -0,0 +1,187 @@
+import html
+import json
+import os
+import shutil
+import threading
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from classes.artifact_store import ArtifactStore
+from classes.pypi_client import PyPIClient
+
+class IndexServer:
+    """
+    Local stand-in of the PyPI index serving the artifact store, so that pip (e.g., the dependency installs of
+    complexity/dataset.py) and the PyPI client can run against the store:
+        * /pypi/<name>/json -> JSON API (only the releases);
+        * /simple/ and /simple/<name>/ -> simple repository API (PEP 503), with the SHA-256 digest in the links;
+        * /files/<name>/<version>/<filename> -> distribution files.
+    The index lists the files of the releases metadata: a file missing from the store is downloaded the first time it is
+    requested. In offline mode only the stored files are listed and served.
+    """
+    def __init__(self, store: ArtifactStore, host: str="127.0.0.1", port: int=0) -> None:
+        """
+        :param store: artifact store to serve
+        :param host: address of the server
+        :param port: port of the server, 0 to choose a free port
+        """
+        self.__store: ArtifactStore = store
+        self.__server: ThreadingHTTPServer = ThreadingHTTPServer((host, port), self.__make_handler())
+        self.__thread: threading.Thread | None = None
+
+    def __enter__(self) -> "IndexServer":
+        self.start()
+
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def get_url(self) -> str:
+        """
+        :return: base URL of the server
+        """
+        host, port = self.__server.server_address[: 2]
+
+        return f"http://{host}:{port}"
+
+    def get_simple_url(self) -> str:
+        """
+        :return: URL of the simple repository API, to use as pip --index-url
+        """
+        return f"{self.get_url()}/simple/"
+
+    def start(self) -> None:
+        """
+        Serve the store in a background thread.
+        """
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def get_releases(self, name: str) -> dict:
+        """
+        :param name: name of the package
+        :return: releases of the package (version -> files) pointing to the files served by the index
+        """
+        client = self.__store.get_client()
+        stored = {(version, filename): digest for version, filename, digest in self.__store.iter_artifacts(name)}
+        releases = {}
+
+        for version, release_files in client.get_releases(name).items():
+            releases[version] = []
+
+            for release_file in release_files:
+                if client.is_offline() and (version, release_file.get("filename")) not in stored:
+                    continue
+
+                releases[version].append({**release_file, "url": self.__get_file_url(name, version, release_file["filename"])})
+
+        # stored artifacts whose metadata are not available (e.g., offline mode without cached metadata)
+        for (version, filename), digest in stored.items():
+            if not any(release_file["filename"] == filename for release_file in releases.get(version, [])):
+                releases.setdefault(version, []).append({"filename": filename,
+                                                         "url": self.__get_file_url(name, version, filename),
+                                                         "digests": {"sha256": digest},
+                                                         "packagetype": "bdist_wheel" if filename.endswith(".whl") else "sdist"})
+
+        return releases
+
+    def __get_file_url(self, name: str, version: str, filename: str) -> str:
+        return f"{self.get_url()}/files/{PyPIClient.normalize_name(name)}/{urllib.parse.quote(version)}/{urllib.parse.quote(filename)}"
+
+    def __get_simple_page(self, name: str) -> str:
+        links = []
+
+        for version, release_files in self.get_releases(name).items():
+            for release_file in release_files:
+                url = release_file["url"]
+
+                if (sha256 := release_file.get("digests", {}).get("sha256")) is not None:
+                    url = f"{url}#sha256={sha256}"
+
+                attributes = f'href="{html.escape(url)}"'
+
+                if release_file.get("requires_python"):
+                    attributes += f' data-requires-python="{html.escape(release_file["requires_python"])}"'
+
+                if release_file.get("yanked", False):
+                    attributes += f' data-yanked="{html.escape(release_file.get("yanked_reason") or "")}"'
+
+                links.append(f"<a {attributes}>{html.escape(release_file['filename'])}</a><br/>")
+
+        return f"<!DOCTYPE html>\n<html><body>\n<h1>Links for {html.escape(name)}</h1>\n{chr(10).join(links)}\n</body></html>\n"
+
+    def __get_file(self, name: str, version: str, filename: str) -> str | None:
+        """
+        :return: path of the distribution file in the store (downloaded if needed), None if it isn't available
+        """
+        for release_file in self.__store.get_client().get_releases(name).get(version, []):
+            if release_file.get("filename") == filename:
+                try:
+                    return self.__store.fetch(name, version, release_file)
+                except Exception as e:
+                    print(f"Unable to fetch {filename}: {e}")
+                    return None
+
+        return self.__store.get(name, version, filename)
+
+    def __make_handler(self) -> type[BaseHTTPRequestHandler]:
+        # private members are bound here: inside Handler their names would be mangled with the handler class name
+        get_releases, get_simple_page, get_file = self.get_releases, self.__get_simple_page, self.__get_file
+        store = self.__store
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                parts = [urllib.parse.unquote(part) for part in urllib.parse.urlparse(self.path).path.split("/") if not part == ""]
+
+                try:
+                    if len(parts) == 3 and parts[0] == "pypi" and parts[2] == "json":
+                        releases = get_releases(parts[1])
+
+                        if len(releases) == 0:
+                            self.send_error(404)
+                        else:
+                            self.__send(json.dumps({"info": {"name": parts[1]}, "releases": releases}).encode(), "application/json")
+                    elif parts == ["simple"]:
+                        links = "\n".join(f'<a href="{name}/">{name}</a><br/>' for name in store.iter_projects())
+
+                        self.__send(f"<!DOCTYPE html>\n<html><body>\n{links}\n</body></html>\n".encode(), "text/html")
+                    elif len(parts) == 2 and parts[0] == "simple":
+                        if not parts[1] == PyPIClient.normalize_name(parts[1]): # PEP 503 redirect to the normalized name
+                            self.send_response(301)
+                            self.send_header("Location", f"/simple/{PyPIClient.normalize_name(parts[1])}/")
+                            self.end_headers()
+                        else:
+                            self.__send(get_simple_page(parts[1]).encode(), "text/html")
+                    elif len(parts) == 4 and parts[0] == "files" and (path := get_file(*parts[1:])) is not None:
+                        with open(path, "rb") as f:
+                            self.send_response(200)
+                            self.send_header("Content-Type", "application/octet-stream")
+                            self.send_header("Content-Length", str(os.path.getsize(path)))
+                            self.end_headers()
+
+                            shutil.copyfileobj(f, self.wfile)
+                    else:
+                        self.send_error(404)
+                except BrokenPipeError:
+                    pass
+
+            def __send(self, body: bytes, content_type: str) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass # no log for each request
+
+        return Handler
@@ -93,6 +93,23 @@ class LHDiff:
         left_content = git_show(commit_left, file_path)
         right_content = git_show(commit_right, file_path)
 
+        return self.diff_contents(left_content, right_content, raw)
+
+    def diff_contents(self, left_content: str, right_content: str, raw: bool=True) -> None | list[dict[str, int | None]] | str:
+        """
+        Executes the lhdiff tool on two versions of a file already in memory (e.g., streamed by git cat-file).
+
+        Parameters:
+            :param left_content: str
+                The content of the earlier version of the file.
+            :param right_content: str
+                The content of the later version of the file.
+            :param raw: bool, optional
+                A flag indicating whether to return the raw output of lhdiff. Defaults to True.
+
+        :returns: None | list[dict[str, int | None]] | str
+            Returns `None` if lhdiff fails, otherwise see diff.
+        """
         # Write to temp files and call lhdiff
         with tempfile.NamedTemporaryFile(mode="w+", delete=False) as left_tmp, \
                 tempfile.NamedTemporaryFile(mode="w+", delete=False) as right_tmp:
@@ -102,7 +119,7 @@ class LHDiff:
                 right_tmp.write(right_content)
                 right_tmp.flush()
 
-                cmd = ["lhdiff"]
+                cmd = [self.__command_path]
                 cmd += [left_tmp.name, right_tmp.name]
 
                 result = subprocess.run(cmd, capture_output=True, text=True, check=True)
@@ -114,4 +131,4 @@ class LHDiff:
             finally:
                 # erase temp files
                 os.unlink(left_tmp.name)
-                os.unlink(right_tmp.name)
\ No newline at end of file
+                os.unlink(right_tmp.name)
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+
+LINE_MAPPING_CACHE_DIR: str = "./cache/line-mappings" # path of the directory containing the cached line mappings
+
+class LineMappingCache:
+    """
+    Persistent cache of the line mappings between two versions of a file (output of a line tracker, [{left, right}]).
+    A mapping is keyed by the SHA-256 of the two contents, so it is computed once whatever the commits (or the
+    repository) the pair of versions comes from. Each line tracker has its own sub-directory, since different trackers
+    can map the same pair differently.
+    """
+    def __init__(self, tracker_name: str, cache_dir: str=LINE_MAPPING_CACHE_DIR) -> None:
+        """
+        :param tracker_name: name of the line tracker producing the mappings (e.g., "lhdiff")
+        :param cache_dir: path to the directory of the cache
+        """
+        self.__cache_dir: str = os.path.join(cache_dir, tracker_name)
+
+    @staticmethod
+    def get_key(left: bytes, right: bytes) -> str:
+        """
+        :param left: content of the older version
+        :param right: content of the newer version
+        :return: key of the pair of versions
+        """
+        return f"{hashlib.sha256(left).hexdigest()}-{hashlib.sha256(right).hexdigest()}"
+
+    def __get_entry_path(self, key: str) -> str:
+        return os.path.join(self.__cache_dir, key[: 2], f"{key}.json")
+
+    def get(self, left: bytes, right: bytes) -> list[dict[str, int | None]] | None:
+        """
+        :param left: content of the older version
+        :param right: content of the newer version
+        :return: cached mapping of the pair, None if it has never been computed
+        """
+        try:
+            with open(self.__get_entry_path(self.get_key(left, right))) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, left: bytes, right: bytes, mapping: list[dict[str, int | None]]) -> None:
+        """
+        Store the mapping of a pair of versions.
+
+        :param left: content of the older version
+        :param right: content of the newer version
+        :param mapping: mapping of the pair
+        """
+        entry_path = self.__get_entry_path(self.get_key(left, right))
+
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+            # write on a temporary file and rename it, so that concurrent processes never read a partial entry
+            tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+
+            with open(tmp_path, "w") as f:
+                json.dump(mapping, f)
+
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            print(f"Unable to cache the line mapping: {e}")
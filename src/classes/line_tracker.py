@@ -0,0 +1,142 @@
+import difflib
+
+class LineTracker:
+    """
+    In-process line tracker, an alternative to the external lhdiff tool with the same output ([{left, right}], one
+    mapping for each line of the older version). It follows the approach of LHDiff:
+        * anchors -> lines left unchanged (whitespace aside) by the diff of the two versions are mapped directly;
+        * changed lines -> inside each changed region, every older line is compared with the newer lines by content
+        similarity and context similarity (the lines around it), and the best pairs above a threshold are mapped;
+        * moved lines -> older lines still unmapped are mapped to an unmapped newer line with the same content, if it is
+        the only one.
+    It works on in-memory strings, so no process is spawned and no file is written.
+    """
+    CONTEXT_SIZE: int = 4 # lines above and below a line forming its context
+    CONTENT_WEIGHT: float = 0.6 # weight of the content similarity (the context similarity weighs the rest)
+    SIMILARITY_THRESHOLD: float = 0.45 # minimum combined similarity to map a changed line
+    WINDOW_SIZE: int = 50 # newer lines compared with an older line, on each side of its expected position in the region
+
+    @staticmethod
+    def __normalize(line: str) -> str:
+        return " ".join(line.split())
+
+    @staticmethod
+    def __split_lines(content: str) -> list[str]:
+        """
+        :param content: content of the file
+        :return: lines of the file, split only on newlines as the line numbers of the detector (str.splitlines also
+        splits on form feeds and other separators)
+        """
+        lines = content.split("\n")
+
+        return lines[: -1] if lines[-1] == "" else lines
+
+    def __get_context(self, lines: list[str], idx: int) -> str:
+        """
+        :param lines: normalized lines of the version
+        :param idx: index of the line
+        :return: context of the line (non-blank lines around it)
+        """
+        above = [line for line in lines[max(0, idx - self.CONTEXT_SIZE): idx] if not line == ""]
+        below = [line for line in lines[idx + 1: idx + 1 + self.CONTEXT_SIZE] if not line == ""]
+
+        return "\n".join(above + below)
+
+    def __match_region(self, left: list[str], right: list[str], left_range: range, right_range: range, mapping: dict[int, int]) -> None:
+        """
+        Map the lines of a changed region by similarity.
+
+        :param left: normalized lines of the older version
+        :param right: normalized lines of the newer version
+        :param left_range: indexes of the older lines of the region
+        :param right_range: indexes of the newer lines of the region
+        :param mapping: older line index -> newer line index, updated with the mapped lines
+        """
+        candidates = []
+        right_contexts = {j: self.__get_context(right, j) for j in right_range}
+        content_matcher, context_matcher = difflib.SequenceMatcher(autojunk=False), difflib.SequenceMatcher(autojunk=False)
+
+        for i in left_range:
+            if left[i] == "":
+                continue
+
+            content_matcher.set_seq2(left[i])
+            context_matcher.set_seq2(self.__get_context(left, i))
+
+            # newer lines around the position the older line would have if the region were stretched uniformly
+            center = right_range.start + (i - left_range.start) * len(right_range) // len(left_range)
+
+            for j in range(max(right_range.start, center - self.WINDOW_SIZE), min(right_range.stop, center + self.WINDOW_SIZE + 1)):
+                if right[j] == "":
+                    continue
+
+                content_matcher.set_seq1(right[j])
+
+                if content_matcher.quick_ratio() * self.CONTENT_WEIGHT + (1 - self.CONTENT_WEIGHT) < self.SIMILARITY_THRESHOLD:
+                    continue # can't reach the threshold even with identical contexts
+
+                content_score = content_matcher.ratio() * self.CONTENT_WEIGHT
+                context_matcher.set_seq1(right_contexts[j])
+
+                if content_score + context_matcher.quick_ratio() * (1 - self.CONTENT_WEIGHT) < self.SIMILARITY_THRESHOLD:
+                    continue
+
+                score = content_score + context_matcher.ratio() * (1 - self.CONTENT_WEIGHT)
+
+                if score >= self.SIMILARITY_THRESHOLD:
+                    candidates.append((-score, i, j))
+
+        # best pairs first, each line is mapped at most once
+        mapped_right = set()
+
+        for _, i, j in sorted(candidates):
+            if i not in mapping and j not in mapped_right:
+                mapping[i] = j
+                mapped_right.add(j)
+
+    def diff_contents(self, left_content: str, right_content: str, raw: bool=True) -> list[dict[str, int | None]] | str:
+        """
+        Map the lines of the older version of a file to the lines of the newer one.
+
+        :param left_content: content of the older version
+        :param right_content: content of the newer version
+        :param raw: if True, the mapping is returned in the lhdiff output format ("left,right" lines, "_" for no line)
+        :return: one mapping {left, right} for each line of the older version (1-based line numbers, right is None if the
+        line has been deleted), or its lhdiff output if raw
+        """
+        left = [self.__normalize(line) for line in self.__split_lines(left_content)]
+        right = [self.__normalize(line) for line in self.__split_lines(right_content)]
+        mapping = {}
+        changed_regions = []
+
+        for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, left, right, autojunk=False).get_opcodes():
+            if tag == "equal":
+                mapping.update({i1 + k: j1 + k for k in range(i2 - i1)})
+            elif tag == "replace":
+                changed_regions.append((range(i1, i2), range(j1, j2)))
+
+        for left_range, right_range in changed_regions:
+            self.__match_region(left, right, left_range, right_range, mapping)
+
+        # moved lines: same content, not blank, unique among the unmapped lines of both versions
+        mapped_right = set(mapping.values())
+        unmapped_left, unmapped_right = {}, {}
+
+        for i, line in enumerate(left):
+            if i not in mapping and not line == "":
+                unmapped_left.setdefault(line, []).append(i)
+
+        for j, line in enumerate(right):
+            if j not in mapped_right and not line == "":
+                unmapped_right.setdefault(line, []).append(j)
+
+        for line, indexes in unmapped_left.items():
+            if len(indexes) == 1 and len(unmapped_right.get(line, [])) == 1:
+                mapping[indexes[0]] = unmapped_right[line][0]
+
+        mappings = [{"left": i + 1, "right": mapping[i] + 1 if i in mapping else None} for i in range(len(left))]
+
+        if raw:
+            return "\n".join(f"{elem['left']},{'_' if elem['right'] is None else elem['right']}" for elem in mappings)
+
+        return mappings
@@ -0,0 +1,120 @@
+import pathlib
+import re
+import zipfile
+
+from collections.abc import Iterator
+
+from packaging.tags import sys_tags
+from packaging.utils import InvalidWheelFilename, parse_wheel_filename
+
+from classes.artifact_store import ArtifactStore
+
+class PackageFetcher:
+    """
+    Acquisition of the python files of a package without pip: the wheel named in the releases metadata is fetched
+    through the artifact store (downloaded only the first time) and the .py members of the archive are read in memory,
+    so no interpreter is spawned and no tree is written to disk.
+    """
+    # files of the .data directory installed in site-packages, as pip does (e.g., pkg-1.0.data/purelib/pkg/mod.py -> pkg/mod.py)
+    __DATA_DIR_PATTERN: re.Pattern = re.compile(r"^[^/]+\.data/(purelib|platlib)/")
+
+    def __init__(self, store: ArtifactStore) -> None:
+        """
+        :param store: artifact store providing the distribution files (its client provides the releases metadata)
+        """
+        self.__store: ArtifactStore = store
+        # compatible tags of the running interpreter, from the most to the least preferred (the order used by pip)
+        self.__tag_ranks: dict[str, int] = {}
+
+        for rank, tag in enumerate(sys_tags()):
+            self.__tag_ranks.setdefault(str(tag), rank)
+
+    def select_wheel(self, release_files: list[dict]) -> dict | None:
+        """
+        Choose the wheel to analyze among the files of a release: the one whose tags are the most preferred by the
+        running interpreter, as pip would install.
+
+        :param release_files: files of the release, as listed in the releases metadata
+        :return: metadata of the wheel, None if the release has no (not yanked) wheel compatible with the interpreter
+        """
+        best_wheel, best_rank = None, None
+
+        for release_file in release_files:
+            if not release_file.get("packagetype") == "bdist_wheel" or release_file.get("yanked", False):
+                continue
+
+            try:
+                _, _, _, tags = parse_wheel_filename(release_file["filename"])
+            except (InvalidWheelFilename, KeyError):
+                continue
+
+            rank = min((self.__tag_ranks[str(tag)] for tag in tags if str(tag) in self.__tag_ranks), default=None)
+
+            if rank is not None and (best_rank is None or rank < best_rank):
+                best_wheel, best_rank = release_file, rank
+
+        return best_wheel
+
+    def get_wheel(self, pkg: str, version: str) -> dict | None:
+        """
+        :param pkg: name of the package
+        :param version: version of the package
+        :return: metadata of the wheel to analyze, None if there isn't one
+        """
+        return self.select_wheel(self.__store.get_client().get_releases(pkg).get(version, []))
+
+    def get_sdist(self, pkg: str, version: str) -> dict | None:
+        """
+        :param pkg: name of the package
+        :param version: version of the package
+        :return: metadata of the (not yanked) source distribution of the version, None if there isn't one
+        """
+        for release_file in self.__store.get_client().get_releases(pkg).get(version, []):
+            if release_file.get("packagetype") == "sdist" and not release_file.get("yanked", False):
+                return release_file
+
+        return None
+
+    def fetch(self, pkg: str, version: str, release_file: dict) -> str:
+        """
+        :param pkg: name of the package
+        :param version: version of the package
+        :param release_file: metadata of the distribution file, as listed in the releases
+        :return: path of the distribution file in the artifact store
+        :raises: see ArtifactStore.fetch
+        """
+        return self.__store.fetch(pkg, version, release_file)
+
+    def iter_wheel_sources(self, pkg: str, version: str, wheel: dict) -> Iterator[tuple[str, bytes]]:
+        """
+        Fetch a wheel and read its python files in memory.
+
+        :param pkg: name of the package
+        :param version: version of the package
+        :param wheel: metadata of the wheel (url, filename and digests), as returned by get_wheel
+        :return: see iter_archive_sources
+        :raises: see ArtifactStore.fetch, zipfile.BadZipFile if the wheel is corrupted
+        """
+        return self.iter_archive_sources(self.fetch(pkg, version, wheel))
+
+    def iter_archive_sources(self, wheel_path: str) -> Iterator[tuple[str, bytes]]:
+        """
+        Read the python files of a wheel in memory.
+
+        :param wheel_path: path of the wheel
+        :return: iterator of (path of the file once installed, content of the file), sorted by path
+        :raises: zipfile.BadZipFile if the wheel is corrupted
+        """
+        with open(wheel_path, "rb") as file:
+            with zipfile.ZipFile(file) as archive:
+                members = {}
+
+                for info in archive.infolist():
+                    if info.is_dir() or not info.filename.endswith(".py"):
+                        continue
+
+                    members[self.__DATA_DIR_PATTERN.sub("", info.filename)] = info
+
+                # same order of the files of an installed tree
+                for name in sorted(members.keys(), key=lambda name: pathlib.PurePosixPath(name).parts):
+                    yield name, archive.read(members[name])
@@ -5,14 +5,21 @@ import subprocess
 import re
 
 from classes.file_shadowing_history import FileShadowingHistoty
+from classes.git_cat_file import GitCatFile
+from classes.line_mapping_cache import LineMappingCache
+from classes.result_cache import ResultCache
 
 PYPI_API: str = "https://pypi.org/pypi/<package-name>/json"
 TEMP_PATH: str = "./tmp"
 
 class PackageShadowingHistory:
-    def __init__(self, pck_name: str, heuristic_path: str="./heuristics") -> None:
+    def __init__(self, pck_name: str, heuristic_path: str="./heuristics", line_tracker: str="lhdiff", incremental: bool=False) -> None:
         self.__pck_name: str = pck_name
         self.__heuristic_path: str = heuristic_path
+        self.__line_tracker: str = line_tracker # see FileShadowingHistoty
+        self.__incremental: bool = incremental # see FileShadowingHistoty
+        self.__result_cache: ResultCache = ResultCache(heuristic_path) # shared by the files of the package
+        self.__line_mapping_cache: LineMappingCache = LineMappingCache(line_tracker) # shared by the files of the package
 
         download_path = f"{TEMP_PATH}/{self.__pck_name}"
 
@@ -61,8 +68,9 @@ class PackageShadowingHistory:
 
         return git_log.stdout
 
-    def __file_history(self, filename: str, until: str) -> dict:
-        file_history = FileShadowingHistoty(self.__get_gitlog(filename, until), filename, self.__heuristic_path)
+    def __file_history(self, filename: str, until: str, cat_file: GitCatFile) -> dict:
+        file_history = FileShadowingHistoty(self.__get_gitlog(filename, until), filename, self.__heuristic_path, self.__result_cache, cat_file,
+                                            self.__line_mapping_cache, self.__line_tracker, self.__incremental)
         file_history.build()
 
         return file_history.get_file_history()
@@ -72,10 +80,12 @@ class PackageShadowingHistory:
             "files" : {}
         }
 
-        for py_file in pathlib.Path().glob(f"./tmp/{self.__pck_name}/**/*.py"): # considers only python files in all possible directories
-            key = f"./{'/'.join(str(py_file).split('/')[2:])}" # relative path of the file (wrt repository root)
+        # one git cat-file process serves the versions of all the files of the repository
+        with GitCatFile(f"{TEMP_PATH}/{self.__pck_name}") as cat_file:
+            for py_file in pathlib.Path().glob(f"./tmp/{self.__pck_name}/**/*.py"): # considers only python files in all possible directories
+                key = f"./{'/'.join(str(py_file).split('/')[2:])}" # relative path of the file (wrt repository root)
 
-            history["files"][key] = self.__file_history(str(py_file), until)
+                history["files"][key] = self.__file_history(str(py_file), until, cat_file)
 
         shutil.rmtree(TEMP_PATH, ignore_errors=True)
 
@@ -0,0 +1,76 @@
+# version of the aggregation (1: statistics of the last file, 2: unqualified scope names), bump it when the statistics change
+SUMMARY_VERSION: str = "3"
+
+class PackageSummary:
+    """
+    Streaming aggregation of the detector results of the files of a package: each file result is folded into the summary
+    as soon as it is available, so no per-file result is kept. The aggregation is:
+        * local_import, inner_function -> union of the lists, each scope name qualified by the path of its file
+        ("<relative path>:<scope name>"): scope names are unique only within a file;
+        * scope_chain_length -> max;
+        * number_of_scopes -> sum;
+        * shadowing and rule hits -> any of the files.
+    Every operation is commutative and associative, so the summary doesn't depend on the order in which files complete
+    and partial summaries (e.g., built by parallel scanners) can be merged.
+    """
+    # YARA rules and AST heuristics reported in the package statistics
+    RULES: tuple[str, ...] = ("patch_decorator_import", "patch_decorator_usage", "contextmanager_import", "contextmanager_usage",
+                              "with_statement", "overwrite_method_class")
+
+    def __init__(self) -> None:
+        self.__local_import: set[str] = set()
+        self.__inner_function: set[tuple[str, ...]] = set()
+        self.__number_of_scopes: int = 0
+        self.__scope_chain_length: int = 0
+        self.__shadowing: bool = False
+        self.__rule_hits: set[str] = set()
+        self.__skipped_files: dict[str, str] = {}
+
+    def add(self, result: dict, relative_path: str) -> None:
+        """
+        Fold the result of a file into the summary.
+
+        :param result: result of the file, as returned by scan_file
+        :param relative_path: path of the file, relative to the package
+        """
+        self.__local_import.update(f"{relative_path}:{scope}" for scope in result["local_import"])
+        self.__inner_function.update(tuple(f"{relative_path}:{scope}" for scope in chain) for chain in result["inner_function"])
+        self.__number_of_scopes += result["number_of_scopes"]
+        self.__scope_chain_length = max(self.__scope_chain_length, result["scope_chain_length"])
+        self.__shadowing = self.__shadowing or len(result["shadowing"]) > 0 or len(result["yara"]) > 0
+        self.__rule_hits.update(rule["name"] for rule in result["yara"] if rule["name"] in self.RULES)
+
+    def add_skipped(self, relative_path: str, reason: str) -> None:
+        """
+        Record a file that hasn't been analyzed because over the budget.
+
+        :param relative_path: path of the file, relative to the package
+        :param reason: reason ("timeout", "oom")
+        """
+        self.__skipped_files[relative_path] = reason
+
+    def merge(self, other: "PackageSummary") -> None:
+        """
+        Fold another summary (e.g., of a subset of the files) into this one.
+
+        :param other: summary to merge
+        """
+        self.__local_import.update(other.__local_import)
+        self.__inner_function.update(other.__inner_function)
+        self.__number_of_scopes += other.__number_of_scopes
+        self.__scope_chain_length = max(self.__scope_chain_length, other.__scope_chain_length)
+        self.__shadowing = self.__shadowing or other.__shadowing
+        self.__rule_hits.update(other.__rule_hits)
+        self.__skipped_files.update(other.__skipped_files)
+
+    def get_statistics(self) -> dict:
+        """
+        :return: statistics of the package (lists are sorted, so the output doesn't depend on the order of the files)
+        """
+        return {"local_import": sorted(self.__local_import),
+                "inner_function": [list(chain) for chain in sorted(self.__inner_function)],
+                "number_of_scopes": self.__number_of_scopes,
+                "scope_chain_length": self.__scope_chain_length,
+                "shadowing": "true" if self.__shadowing else "false",
+                **{rule: "true" if rule in self.__rule_hits else "false" for rule in self.RULES},
+                "skipped_files": dict(sorted(self.__skipped_files.items()))}
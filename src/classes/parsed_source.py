@@ -0,0 +1,94 @@
+import ast
+import bisect
+import io
+import re
+import tokenize
+
+class ParsedSource:
+    """
+    In-memory representation of a Python source file, built once and shared by every component of the detection
+    pipeline (Detector, ScopeGraph, ASTHeuristics and HeuristicEngine), so that the file is read, decoded and parsed
+    only one time.
+
+    It holds:
+        * raw bytes -> input of the YARA rules (offsets reported by YARA are byte offsets);
+        * decoded code -> decoded respecting the PEP 263 encoding declaration;
+        * AST -> parsed lazily the first time it is requested;
+        * newline offset table -> byte offsets of the newlines, used to translate YARA offsets into line numbers.
+    """
+    def __init__(self, raw: bytes, code_path: str="<memory>") -> None:
+        """
+        :param raw: content of the file
+        :param code_path: path (or name) of the file, used only for reporting
+        """
+        self.__raw: bytes = raw
+        self.__code_path: str = code_path
+        self.__code: str = self.__decode(raw)
+        self.__tree: ast.Module | None = None
+        self.__newline_offsets: list[int] | None = None
+
+    @classmethod
+    def from_path(cls, code_path: str) -> "ParsedSource":
+        """
+        Build the source reading the file from disk.
+
+        :param code_path: path to the file
+        :return: source of the file
+        """
+        with open(code_path, "rb") as f:
+            return cls(f.read(), code_path)
+
+    @staticmethod
+    def __decode(raw: bytes) -> str:
+        """
+        Decode the content of the file in the same way as tokenize.open does (PEP 263 encoding declaration and universal
+        newlines).
+
+        :param raw: content of the file
+        :return: decoded code
+        """
+        try:
+            encoding, _ = tokenize.detect_encoding(io.BytesIO(raw).readline)
+
+            return io.TextIOWrapper(io.BytesIO(raw), encoding=encoding).read()
+        except (SyntaxError, UnicodeDecodeError, LookupError):
+            # Fallback: decode with UTF-8 and replace undecodable bytes.
+            # This keeps the pipeline running; files with severe encoding issues may still fail to parse.
+            return io.TextIOWrapper(io.BytesIO(raw), encoding="utf-8", errors="replace").read()
+
+    def get_code_path(self) -> str:
+        return self.__code_path
+
+    def get_raw(self) -> bytes:
+        return self.__raw
+
+    def get_code(self) -> str:
+        return self.__code
+
+    def get_tree(self) -> ast.Module:
+        """
+        :return: AST of the code, parsed only the first time it is requested
+        :raises: SyntaxError (or ValueError) if the code can't be parsed
+        """
+        if self.__tree is None:
+            self.__tree = ast.parse(self.__code)
+
+        return self.__tree
+
+    def get_newline_offsets(self) -> list[int]:
+        """
+        :return: sorted list containing the byte offset of each newline in the raw content
+        """
+        if self.__newline_offsets is None:
+            self.__newline_offsets = [match.start() for match in re.finditer(b"\n", self.__raw)]
+
+        return self.__newline_offsets
+
+    def get_line_number(self, offset: int) -> int:
+        """
+        Translate a byte offset of the raw content into a line number, with a binary search on the newline offset table.
+
+        :param offset: byte offset (e.g., the offset of a YARA string instance)
+        :return: line number (starting from 1) containing the offset
+        """
+        return bisect.bisect_left(self.get_newline_offsets(), offset) + 1
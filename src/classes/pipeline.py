@@ -0,0 +1,75 @@
+import queue
+import threading
+
+from collections.abc import Callable, Iterable
+
+class Pipeline:
+    """
+    Bounded producer/consumer pipeline: the items flow through a sequence of stages connected by bounded queues, and each
+    stage runs its function in its own pool of threads. A stage whose output queue is full blocks, so a fast stage (e.g.,
+    downloads) can't run ahead of a slow one (e.g., scanning) by more than the queue size: every stage is kept busy
+    while the items in flight (and the resources they hold, such as memory or temporary files) stay bounded.
+
+    The function of a stage takes an item and returns the item for the next stage, or None to drop it. The output of
+    the last stage is discarded, so the last stage is the sink (e.g., writing the results).
+    """
+    __STOP: object = object() # sentinel telling a worker that its stage has no more items
+
+    def __init__(self) -> None:
+        self.__stages: list[tuple[str, Callable, int, int]] = []
+
+    def add_stage(self, name: str, func: Callable[[object], object | None], workers: int=1, queue_size: int=1) -> "Pipeline":
+        """
+        Append a stage to the pipeline.
+
+        :param name: name of the stage, used only for reporting
+        :param func: function applied to each item
+        :param workers: number of threads running the function (concurrency limit of the stage)
+        :param queue_size: maximum number of items waiting for the stage
+        :return: the pipeline itself
+        """
+        self.__stages.append((name, func, workers, queue_size))
+
+        return self
+
+    def run(self, items: Iterable) -> None:
+        """
+        Push the items through the pipeline and wait until all of them have gone through every stage.
+
+        :param items: input of the first stage, consumed lazily
+        """
+        queues = [queue.Queue(maxsize=queue_size) for _, _, _, queue_size in self.__stages] + [None]
+        threads = []
+
+        for idx, (name, func, workers, _) in enumerate(self.__stages):
+            threads.append([threading.Thread(target=self.__work, args=(name, func, queues[idx], queues[idx + 1]), daemon=True, name=f"{name}-{i}")
+                            for i in range(workers)])
+
+            for thread in threads[-1]:
+                thread.start()
+
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            # stages are closed in order: once all the workers of a stage are done, the next stage gets no more items
+            for idx, stage_threads in enumerate(threads):
+                for _ in stage_threads:
+                    queues[idx].put(self.__STOP)
+
+                for thread in stage_threads:
+                    thread.join()
+
+    def __work(self, name: str, func: Callable, input_queue: queue.Queue, output_queue: queue.Queue | None) -> None:
+        """
+        Main loop of a worker of a stage.
+        """
+        while (item := input_queue.get()) is not self.__STOP:
+            try:
+                result = func(item)
+            except Exception as e:
+                print(f"Error in the {name} stage: {e}")
+                continue
+
+            if result is not None and output_queue is not None:
+                output_queue.put(result)
@@ -0,0 +1,257 @@
+import collections
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+
+from requests.adapters import HTTPAdapter
+
+class PyPIClient:
+    """
+    Client of the PyPI JSON API used to retrieve the releases of the packages.
+    The client keeps a pool of connections (one requests.Session) and caches the releases:
+        * on disk -> one JSON file per package, valid for ttl seconds, then revalidated with the ETag of the response
+        (a 304 response costs no payload);
+        * in memory -> the most recently used packages, so repeated lookups of the same package (e.g., one for each
+        year) don't read the disk.
+    Many packages can be fetched concurrently with prefetch, within a rate limit.
+    In offline mode the client never touches the network: every cached entry is used, whatever its age.
+    """
+    def __init__(self, api_url: str="https://pypi.org/pypi/<package-name>/json", cache_dir: str="./cache/pypi", ttl: float=86400,
+                 timeout: float=20, max_workers: int=8, requests_per_second: float=10, memory_cache_size: int=256,
+                 offline: bool=False) -> None:
+        """
+        :param api_url: URL of the JSON API, <package-name> is replaced by the name of the package
+        :param cache_dir: path to the directory of the on-disk cache
+        :param ttl: number of seconds after which a cached entry has to be revalidated
+        :param timeout: timeout (seconds) of each request
+        :param max_workers: number of concurrent requests of prefetch, it is also the size of the connection pool
+        :param requests_per_second: maximum number of requests per second
+        :param memory_cache_size: number of packages kept in memory
+        :param offline: if True, the releases are served only from the cache and nothing is downloaded
+        """
+        self.__api_url: str = api_url
+        self.__cache_dir: str = cache_dir
+        self.__ttl: float = ttl
+        self.__timeout: float = timeout
+        self.__max_workers: int = max_workers
+        self.__min_interval: float = 1 / requests_per_second
+        self.__memory_cache_size: int = memory_cache_size
+        self.__offline: bool = offline
+        self.__memory_cache: collections.OrderedDict[str, dict] = collections.OrderedDict()
+        self.__lock: threading.Lock = threading.Lock() # protects the memory cache
+        self.__rate_lock: threading.Lock = threading.Lock()
+        self.__next_request_time: float = 0
+
+        self.__session: requests.Session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+
+        self.__session.mount("https://", adapter)
+        self.__session.mount("http://", adapter)
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def is_offline(self) -> bool:
+        return self.__offline
+
+    @staticmethod
+    def normalize_name(pkg: str) -> str:
+        """
+        :param pkg: name of the package
+        :return: normalized name of the package (PEP 503)
+        """
+        return re.sub(r"[-_.]+", "-", pkg).lower()
+
+    def __get_cache_path(self, pkg: str) -> str:
+        return os.path.join(self.__cache_dir, f"{self.normalize_name(pkg)}.json")
+
+    def __read_cache(self, pkg: str) -> dict | None:
+        """
+        :return: cached entry ({fetched_at, etag, releases}) of the package, None if the package is not cached
+        """
+        with self.__lock:
+            if (key := self.normalize_name(pkg)) in self.__memory_cache:
+                self.__memory_cache.move_to_end(key)
+
+                return self.__memory_cache[key]
+
+        try:
+            with open(self.__get_cache_path(pkg)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        self.__remember(pkg, entry)
+
+        return entry
+
+    def __write_cache(self, pkg: str, entry: dict) -> None:
+        # the entry is written aside and then renamed, so concurrent readers (even in other processes) never see a partial file
+        cache_path = self.__get_cache_path(pkg)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f)
+
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"PyPI cache error for {pkg}: {e}")
+
+        self.__remember(pkg, entry)
+
+    def __remember(self, pkg: str, entry: dict) -> None:
+        key = self.normalize_name(pkg)
+
+        with self.__lock:
+            self.__memory_cache[key] = entry
+            self.__memory_cache.move_to_end(key)
+
+            while len(self.__memory_cache) > self.__memory_cache_size:
+                self.__memory_cache.popitem(last=False)
+
+    def __is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.__ttl
+
+    def __throttle(self) -> None:
+        """
+        Wait until a new request can be issued without exceeding the rate limit.
+        """
+        with self.__rate_lock:
+            now = time.monotonic()
+            wait = self.__next_request_time - now
+            self.__next_request_time = max(now, self.__next_request_time) + self.__min_interval
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def __fetch(self, pkg: str, entry: dict | None) -> dict | None:
+        """
+        Download the releases of the package, revalidating the cached entry if there is one.
+
+        :param pkg: name of the package
+        :param entry: cached (stale) entry of the package
+        :return: updated entry, None if the releases can't be retrieved
+        """
+        headers = {"Accept": "application/json"}
+
+        if entry is not None and entry.get("etag") is not None:
+            headers["If-None-Match"] = entry["etag"]
+
+        self.__throttle()
+
+        try:
+            response = self.__session.get(self.__api_url.replace("<package-name>", pkg), headers=headers, timeout=self.__timeout)
+
+            if response.status_code == 304 and entry is not None: # not modified
+                entry = {**entry, "fetched_at": time.time()}
+                self.__write_cache(pkg, entry)
+
+                return entry
+
+            if response.status_code == 404: # the package doesn't exist: it has no releases, it isn't a failure
+                payload = {}
+            else:
+                response.raise_for_status()
+                payload = response.json()
+        except requests.RequestException as e:
+            print(f"PyPI request error for {pkg}: {e}")
+            return entry # stale entry is better than nothing
+        except ValueError as e:
+            print(f"Invalid JSON from PyPI for {pkg}: {e}")
+            return entry
+
+        releases = payload.get("releases", {})
+
+        if not isinstance(releases, dict):
+            releases = {}
+
+        entry = {"fetched_at": time.time(), "etag": response.headers.get("ETag"), "releases": releases}
+        self.__write_cache(pkg, entry)
+
+        return entry
+
+    def get_releases(self, pkg: str, strict: bool=False) -> dict:
+        """
+        Retrieve all PyPI releases for a package, from the cache if the cached entry is still valid.
+
+        :param pkg: name of the package
+        :param strict: if True, a failure (e.g., a timeout, a 5xx response or a package not cached in offline mode) raises
+                       instead of looking like a package without releases
+        :return: dictionary version -> list of the release files, empty if the package has no releases (or if the
+        releases can't be retrieved and strict is False)
+        :raises: ConnectionError if strict and the releases can't be retrieved
+        """
+        entry = self.__read_cache(pkg)
+
+        if not self.__offline and (entry is None or not self.__is_fresh(entry)):
+            entry = self.__fetch(pkg, entry)
+
+        if entry is None and strict:
+            raise ConnectionError(f"The releases of {pkg} can't be retrieved")
+
+        return entry["releases"] if entry is not None else {}
+
+    def prefetch(self, pkgs: list[str]) -> None:
+        """
+        Fetch concurrently the releases of the packages that are not cached (or whose entry has expired), so the
+        following lookups are served by the cache.
+
+        :param pkgs: names of the packages
+        """
+        if self.__offline:
+            return
+
+        missing = []
+
+        for pkg in dict.fromkeys(pkgs): # duplicates removed, order preserved
+            try:
+                # the cache file is rewritten at each (re)validation, so a recent file is fresh without being parsed
+                if time.time() - os.path.getmtime(self.__get_cache_path(pkg)) < self.__ttl:
+                    continue
+            except OSError:
+                pass
+
+            entry = self.__read_cache(pkg)
+
+            if entry is None or not self.__is_fresh(entry):
+                missing.append((pkg, entry))
+
+        with ThreadPoolExecutor(max_workers=self.__max_workers) as executor:
+            for _ in executor.map(lambda item: self.__fetch(*item), missing):
+                pass
+
+    def download(self, url: str, file: BinaryIO, sha256: str | None=None) -> None:
+        """
+        Download a distribution file (e.g., a wheel), streaming it into a file object.
+
+        :param url: URL of the file
+        :param file: file object where the content is written
+        :param sha256: expected SHA-256 hex digest of the file, None to skip the integrity check
+        :raises: requests.RequestException if the file can't be downloaded, ValueError if the digest doesn't match,
+            ConnectionError in offline mode
+        """
+        if self.__offline:
+            raise ConnectionError(f"{url} can't be downloaded in offline mode")
+
+        digest = hashlib.sha256()
+
+        with self.__session.get(url, stream=True, timeout=self.__timeout) as response:
+            response.raise_for_status()
+
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                digest.update(chunk)
+                file.write(chunk)
+
+        if sha256 is not None and not digest.hexdigest() == sha256:
+            raise ValueError(f"SHA-256 mismatch for {url}")
+
+    def close(self) -> None:
+        self.__session.close()
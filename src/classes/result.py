@@ -20,3 +20,13 @@ class Result:
 
     def set_lines(self, lines: list[int]) -> None:
         self.__lines = lines
+
+    def to_dict(self) -> dict:
+        """
+        :return: JSON-serializable representation of the result
+        """
+        return {"name": self.__name, "lines": list(self.__lines)}
+
+    @staticmethod
+    def from_dict(data: dict) -> "Result":
+        return Result(name=data["name"], lines=list(data["lines"]))
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+
+from classes.detectorv2 import DETECTOR_VERSION
+from classes.heuristic_engine import HeuristicEngine
+
+RESULT_CACHE_DIR: str = "./cache/results" # path of the directory containing the cached detector results
+
+class ResultCache:
+    """
+    Persistent content-addressed cache of the detector results. A result is keyed by:
+        * SHA-256 of the file content -> byte-identical files (e.g., vendored modules, modules unchanged between releases)
+        share the same entry, whatever package, version or year they come from;
+        * detector version -> DETECTOR_VERSION, bumped when the detection changes;
+        * rule-set digest -> a change to any YARA rule invalidates the entries.
+    Detector version and rule-set digest select a sub-directory, so stale entries are never read and can be removed at
+    once. Entries are JSON files sharded by the first two digits of the hash.
+    """
+    def __init__(self, heuristic_path: str, cache_dir: str=RESULT_CACHE_DIR) -> None:
+        """
+        :param heuristic_path: path to the directory containing YARA rules
+        :param cache_dir: path to the directory of the cache
+        """
+        self.__cache_dir: str = os.path.join(cache_dir, f"{DETECTOR_VERSION}-{HeuristicEngine.get_rules_digest(heuristic_path)}")
+
+    @staticmethod
+    def get_key(raw: bytes) -> str:
+        """
+        :param raw: content of the file
+        :return: SHA-256 hex digest of the content
+        """
+        return hashlib.sha256(raw).hexdigest()
+
+    def __get_entry_path(self, key: str) -> str:
+        return os.path.join(self.__cache_dir, key[: 2], f"{key}.json")
+
+    def get(self, raw: bytes) -> dict | None:
+        """
+        :param raw: content of the file
+        :return: cached result of the file, None if the file has never been analyzed
+        """
+        try:
+            with open(self.__get_entry_path(self.get_key(raw))) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, raw: bytes, result: dict) -> None:
+        """
+        Store the result of a file.
+
+        :param raw: content of the file
+        :param result: JSON-serializable result of the file
+        """
+        entry_path = self.__get_entry_path(self.get_key(raw))
+
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+            # write on a temporary file and rename it, so that concurrent processes never read a partial entry
+            tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+
+            with open(tmp_path, "w") as f:
+                json.dump(result, f)
+
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            print(f"Unable to cache the result: {e}")
@@ -0,0 +1,110 @@
+import json
+import os
+
+from collections.abc import Iterable, Iterator
+
+from classes.detectorv2 import DETECTOR_VERSION
+from classes.package_summary import SUMMARY_VERSION
+
+# version of the statistics: detection and aggregation of the file results. Records of another version are ignored
+STATISTICS_VERSION: str = f"{DETECTOR_VERSION}-{SUMMARY_VERSION}"
+
+class ResultsLog:
+    """
+    Append-only log of the statistics of the analyzed packages (JSON Lines, one record {"package", "version", "statistics",
+    "statistics_version"} per package). Each record is flushed and synced to disk as soon as the package is analyzed, so:
+        * writing a result costs one line, whatever the number of packages already analyzed;
+        * a crash loses at most the record being written (a truncated last line is ignored when the log is read);
+        * resuming skips the packages in the log, whatever the order in which they were analyzed.
+    If a package appears more than once, the last record wins. Records written with another STATISTICS_VERSION (or
+    without one) are ignored, so a resumed run never mixes statistics computed in different ways: their packages are
+    analyzed again. The per-year JSON is produced by compact.
+    """
+    def __init__(self, path: str) -> None:
+        """
+        :param path: path to the log file, created if it doesn't exist
+        """
+        self.__path: str = path
+        self.__done: set[str] = {package for package, _, _ in self.iter_records()}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self.__file = open(path, "a")
+
+        # a record truncated by a crash is terminated, so the next record starts on a new line
+        if self.__file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+
+                if not f.read(1) == b"\n":
+                    self.__file.write("\n")
+
+    def __enter__(self) -> "ResultsLog":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def get_done(self) -> set[str]:
+        """
+        :return: names of the packages having a record of the current version in the log
+        """
+        return self.__done
+
+    def iter_records(self) -> Iterator[tuple[str, str | None, dict | str]]:
+        """
+        :return: iterator of the (package, version, statistics) records of the current version, in the order in which
+        they were written
+        """
+        if not os.path.exists(self.__path):
+            return
+
+        with open(self.__path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # record truncated by a crash
+
+                if not record.get("statistics_version") == STATISTICS_VERSION:
+                    continue # statistics computed by another version of the detection or of the aggregation
+
+                yield record["package"], record.get("version"), record["statistics"]
+
+    def append(self, package: str, statistics: dict | str, version: str | None=None) -> None:
+        """
+        Durably write the record of a package.
+
+        :param package: name of the package
+        :param statistics: statistics of the package
+        :param version: analyzed version of the package, None if unknown
+        """
+        self.__file.write(json.dumps({"package": package, "version": version, "statistics": statistics,
+                                      "statistics_version": STATISTICS_VERSION}) + "\n")
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+        self.__done.add(package)
+
+    def compact(self, packages: Iterable[str], json_path: str) -> dict:
+        """
+        Write the per-year JSON (package -> statistics) from the log. The file is written aside and then renamed, so a
+        crash while compacting can't corrupt the previous one.
+
+        :param packages: names of the packages in the order of the list, packages without a record are left out
+        :param json_path: path to the JSON file
+        :return: dictionary package -> statistics written to the file
+        """
+        records = {package: statistics for package, _, statistics in self.iter_records()}
+        statistics = {package: records[package] for package in packages if package in records}
+        tmp_path = f"{json_path}.tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump(statistics, f, indent=4)
+
+        os.replace(tmp_path, json_path)
+
+        return statistics
+
+    def close(self) -> None:
+        self.__file.close()
@@ -0,0 +1,239 @@
+import multiprocessing
+import signal
+
+try:
+    import resource # not available on Windows: the memory budget is not enforced
+except ImportError:
+    resource = None
+
+from multiprocessing.connection import Connection
+
+from classes.detectorv2 import Detector
+from classes.parsed_source import ParsedSource
+from classes.result_cache import ResultCache
+from classes.scope_segments import ScopeSegments
+
+def scan_file(code_path: str, heuristic_path: str, result_cache: ResultCache | None=None) -> dict:
+    """
+    Run the detector on a file, unless its result is already in the cache.
+
+    :param code_path: path to the file to analyze
+    :param heuristic_path: path to the directory containing YARA rules
+    :param result_cache: cache of the detector results, None to always run the detector
+    :return: see scan_source
+    :raises: Exception if the file can't be analyzed (e.g., the code can't be parsed)
+    """
+    with open(code_path, "rb") as f:
+        return scan_bytes(f.read(), code_path, heuristic_path, result_cache)
+
+def scan_bytes(raw: bytes, code_path: str, heuristic_path: str, result_cache: ResultCache | None=None, segments: ScopeSegments | None=None) -> dict:
+    """
+    Run the detector on the content of a file (e.g., a member of an archive), unless its result is already in the cache.
+
+    :param raw: content of the file
+    :param code_path: path (or name) of the file, used only for reporting
+    :param heuristic_path: path to the directory containing YARA rules
+    :param result_cache: cache of the detector results, None to always run the detector
+    :param segments: segments of the previous version of the file, see scan_source
+    :return: see scan_source
+    :raises: Exception if the file can't be analyzed (e.g., the code can't be parsed)
+    """
+    if result_cache is None:
+        return scan_source(ParsedSource(raw, code_path), heuristic_path, segments)
+
+    if (result := result_cache.get(raw)) is None:
+        result = scan_source(ParsedSource(raw, code_path), heuristic_path, segments)
+        result_cache.put(raw, result)
+    elif segments is not None:
+        segments.reset() # the file isn't visited, the segments don't follow it
+
+    return result
+
+def scan_source(source: ParsedSource, heuristic_path: str, segments: ScopeSegments | None=None) -> dict:
+    """
+    Run the detector on a source and gather the features used by the analysis.
+
+    :param source: source to analyze
+    :param heuristic_path: path to the directory containing YARA rules
+    :param segments: top-level statements of the previous version of the file, to visit only the changed ones (see
+                     ScopeSegments). They are updated to this version. If None, the whole AST is visited.
+    :return: JSON-serializable dictionary containing the detector results:
+        * shadowing: shadowed elements ({name, lines});
+        * yara: YARA and AST heuristics matches ({name, lines});
+        * local_import: scopes with local imports;
+        * inner_function: chains of inner functions;
+        * number_of_scopes: number of scopes in the chains containing inner functions;
+        * scope_chain_length: length of the longest scope chain
+    :raises: ValueError if the code can't be parsed (the message contains the reason), Exception if the file can't be
+    analyzed for another reason
+    """
+    detector = Detector(source.get_code_path(), heuristic_path=heuristic_path, source=source, segments=segments)
+
+    if detector.get_builder() is None:
+        raise ValueError(f"Error parsing the code: {detector.get_error()}") from detector.get_error()
+
+    shadowing, yara = detector.shadowing_detection()
+    inner_function, scopes_number = detector.inner_function_detection()
+
+    return {"shadowing": [result.to_dict() for result in shadowing],
+            "yara": [result.to_dict() for result in yara],
+            "local_import": detector.local_import_detection(),
+            "inner_function": inner_function,
+            "number_of_scopes": scopes_number,
+            "scope_chain_length": detector.get_builder().length_longest_scope_chain()}
+
+def _worker_loop(conn: Connection, heuristic_path: str, memory_limit: int | None, result_cache_dir: str | None) -> None:
+    """
+    Main loop of the worker process: receives the files to analyze, as (path, content) with content None if the file
+    has to be read from disk, and sends back the results.
+
+    :param conn: connection with the parent process
+    :param heuristic_path: path to the directory containing YARA rules
+    :param memory_limit: maximum size (bytes) of the worker address space, None for no limit
+    :param result_cache_dir: path to the directory of the detector results cache, None to disable the cache
+    """
+    result_cache = ResultCache(heuristic_path, result_cache_dir) if result_cache_dir is not None else None
+
+    if memory_limit is not None and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        if request is None: # stop request
+            break
+
+        code_path, raw = request
+
+        try:
+            if raw is None:
+                result = {"status": "ok", **scan_file(code_path, heuristic_path, result_cache)}
+            else:
+                result = {"status": "ok", **scan_bytes(raw, code_path, heuristic_path, result_cache)}
+        except MemoryError:
+            result = None
+        except Exception as e:
+            result = {"status": "error", "reason": str(e)}
+
+        if result is None:
+            # the process state may be compromised after a MemoryError, so the worker exits and gets replaced
+            conn.send({"status": "oom"})
+            break
+
+        conn.send(result)
+
+class ScanWorker:
+    """
+    Isolated worker process running the detector on one file at a time, with a wall-clock timeout and a memory ceiling.
+    A worker exceeding its budget is killed and replaced at the next request, so a pathological file (e.g., multi-megabyte
+    minified modules or giant literal tables) can't stall or crash the analysis.
+    """
+    def __init__(self, heuristic_path: str, timeout: float, memory_limit: int | None=None, result_cache_dir: str | None=None,
+                 start_method: str | None=None) -> None:
+        """
+        :param heuristic_path: path to the directory containing YARA rules
+        :param timeout: maximum number of seconds spent on a single file
+        :param memory_limit: maximum size (bytes) of the worker address space, None for no limit
+        :param result_cache_dir: path to the directory of the detector results cache, None to disable the cache
+        :param start_method: multiprocessing start method of the worker process (e.g., "forkserver" when workers are started
+                             by several threads, where forking is unsafe), None for the platform default
+        """
+        self.__heuristic_path: str = heuristic_path
+        self.__timeout: float = timeout
+        self.__memory_limit: int | None = memory_limit
+        self.__result_cache_dir: str | None = result_cache_dir
+        self.__context = multiprocessing.get_context(start_method)
+        self.__process: multiprocessing.Process | None = None
+        self.__conn: Connection | None = None
+
+    def __enter__(self) -> "ScanWorker":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __start(self) -> None:
+        self.__conn, child_conn = self.__context.Pipe()
+        self.__process = self.__context.Process(target=_worker_loop, args=(child_conn, self.__heuristic_path, self.__memory_limit, self.__result_cache_dir), daemon=True)
+        self.__process.start()
+
+        child_conn.close()
+
+    def __kill(self) -> int | None:
+        """
+        Kill the worker process.
+
+        :return: exit code of the process
+        """
+        if self.__process.is_alive():
+            self.__process.kill()
+
+        self.__process.join()
+        self.__conn.close()
+
+        exitcode = self.__process.exitcode
+        self.__process, self.__conn = None, None
+
+        return exitcode
+
+    def scan(self, code_path: str, raw: bytes | None=None) -> dict:
+        """
+        Analyze a file in the worker process.
+
+        :param code_path: path to the file to analyze (only used for reporting if raw is given)
+        :param raw: content of the file, None to read it from disk
+        :return: result of scan_file with "status": "ok"; otherwise "status" is:
+            * "timeout" -> the analysis exceeded the time budget;
+            * "oom" -> the analysis exceeded the memory budget (or the worker has been killed by the OS);
+            * "crash" -> the worker died unexpectedly;
+            * "error" -> the detector raised an exception, "reason" contains its message.
+        """
+        if self.__process is None or not self.__process.is_alive():
+            if self.__process is not None:
+                self.__kill()
+
+            self.__start()
+
+        try:
+            self.__conn.send((code_path, raw))
+        except OSError:
+            # worker died before reading the request (e.g., killed while idle): it is replaced at the next scan
+            self.__kill()
+
+            return {"status": "crash"}
+
+        if not self.__conn.poll(self.__timeout):
+            self.__kill()
+
+            return {"status": "timeout"}
+
+        try:
+            result = self.__conn.recv()
+        except (EOFError, OSError):
+            # worker died while analyzing the file (the connection is closed or reset), SIGKILL is what the OS OOM killer uses
+            exitcode = self.__kill()
+
+            return {"status": "oom" if exitcode == -signal.SIGKILL else "crash"}
+
+        if result["status"] == "oom":
+            self.__kill()
+
+        return result
+
+    def close(self) -> None:
+        """
+        Stop the worker process.
+        """
+        if self.__process is None:
+            return
+
+        try:
+            self.__conn.send(None)
+            self.__process.join(timeout=1)
+        except (BrokenPipeError, OSError):
+            pass
+
+        self.__kill()
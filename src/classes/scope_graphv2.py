@@ -1,10 +1,155 @@
 import ast
+import sys
 import graphviz # package that allows to draw a graph using a DOT notation
 
-class ScopeGraph(ast.NodeVisitor):
+from array import array
+from collections.abc import Callable, Iterator, Mapping
+from enum import IntEnum
+
+from classes.ast_traversal import ASTTraversal, ScopeContext, TraversalPlugin
+
+class ScopeKind(IntEnum):
+    """
+    Kind of the node that generates a scope
+    """
+    MODULE = 0
+    FUNC = 1
+    AFUNC = 2
+    LAMBDA = 3
+    CLASS = 4
+    LSTCOMP = 5
+    EXCHANDLER = 6
+
+    @property
+    def prefix(self) -> str:
+        """
+        :return: prefix used in the scope names (e.g., s12_func_name)
+        """
+        return ("", "func", "afunc", "lambda", "class", "lstComp", "excHandler")[self]
+
+class SymbolKind(IntEnum):
+    """
+    Kind of a symbol (declaration or reference) of the scope graph
+    """
+    VAR = 0
+    FUNC = 1
+    AFUNC = 2
+    CLASS = 3
+    EXP = 4
+    IMPORT = 5
+
+    @property
+    def prefix(self) -> str:
+        """
+        :return: prefix used in the symbol names (e.g., var_name)
+        """
+        return ("var", "func", "afunc", "class", "exp", "import")[self]
+
+class Usage(IntEnum):
+    """
+    How a symbol occurs in a scope
+    """
+    DECLARATION = 0
+    REFERENCE = 1
+
+class SymbolTable:
+    """
+    Table interning the symbols of a scope graph: each (kind, name) pair is stored once and identified by an integer.
+    """
+    def __init__(self) -> None:
+        self.__ids: dict[tuple[int, str], int] = {}
+        self.__kinds: array = array("B")
+        self.__names: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.__names)
+
+    def intern(self, kind: SymbolKind, name: str) -> int:
+        """
+        :param kind: kind of the symbol
+        :param name: name of the symbol
+        :return: identifier of the symbol, added to the table if not present
+        """
+        key = (kind, name)
+
+        if (symbol := self.__ids.get(key)) is None:
+            symbol = self.__ids[key] = len(self.__names)
+
+            self.__kinds.append(kind)
+            self.__names.append(sys.intern(name))
+
+        return symbol
+
+    def lookup(self, kind: SymbolKind, name: str) -> int | None:
+        """
+        :param kind: kind of the symbol
+        :param name: name of the symbol
+        :return: identifier of the symbol, None if the symbol is not in the table
+        """
+        return self.__ids.get((kind, name))
+
+    def lookup_formatted(self, formatted_name: str) -> int | None:
+        """
+        :param formatted_name: name of the symbol with the prefix of its kind (e.g., var_name)
+        :return: identifier of the symbol, None if the symbol is not in the table
+        """
+        prefix, _, name = formatted_name.partition("_")
+
+        for kind in SymbolKind:
+            if kind.prefix == prefix:
+                return self.lookup(kind, name)
+        return None
+
+    def get_kind(self, symbol: int) -> SymbolKind:
+        return SymbolKind(self.__kinds[symbol])
+
+    def get_name(self, symbol: int) -> str:
+        return self.__names[symbol]
+
+    def format(self, symbol: int) -> str:
+        """
+        :param symbol: identifier of the symbol
+        :return: name of the symbol with the prefix of its kind (e.g., var_name)
+        """
+        return f"{SymbolKind(self.__kinds[symbol]).prefix}_{self.__names[symbol]}"
+
+class ScopeGraphView(Mapping):
+    """
+    Read-only dictionary view of a ScopeGraph, exposing the scope graph with the representation used by the previous
+    versions: scope name -> {"decls": set, "refs": set, "parent": parent name, "have-children": bool}, where decls and
+    refs are sets of (prefixed name, line) tuples.
+    The entries are built on request, so the view doesn't need any additional memory.
+    """
+    def __init__(self, scope_graph: "ScopeGraph") -> None:
+        self.__scope_graph = scope_graph
+
+    def __getitem__(self, scope_name: str) -> dict:
+        try:
+            scope = self.__scope_graph.get_scope_id(scope_name)
+        except ValueError:
+            raise KeyError(scope_name)
+
+        if not scope_name == self.__scope_graph.get_scope_name(scope):
+            raise KeyError(scope_name)
+
+        symbols = self.__scope_graph.get_symbols()
+        parent = self.__scope_graph.get_parent(scope)
+
+        return {"decls": {(symbols.format(symbol), line) for symbol, line in self.__scope_graph.iter_decls(scope)},
+                "refs": {(symbols.format(symbol), line) for symbol, line in self.__scope_graph.iter_refs(scope)},
+                "parent": None if parent is None else self.__scope_graph.get_scope_name(parent),
+                "have-children": self.__scope_graph.has_children(scope)}
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.__scope_graph.get_scope_name(scope) for scope in range(self.__scope_graph.get_scopes_number()))
+
+    def __len__(self) -> int:
+        return self.__scope_graph.get_scopes_number()
+
+class ScopeGraph(TraversalPlugin):
     """
-    The class goal is to build a scope graph from the Abstract Syntax Tree (AST). To do so, we use a NodeVisitor to visit
-    the AST defining a specific visitor for each node type we want to take into account to build the correspondent
+    The class goal is to build a scope graph from the Abstract Syntax Tree (AST). To do so, the scope graph is a plugin of
+    the AST traversal registering a callback for each node type we want to take into account to build the correspondent
     ScopeGraph: local scope, declaration, references (including even the import statements) [see below]
 
     The following classes generate local scope:
@@ -19,195 +164,367 @@ class ScopeGraph(ast.NodeVisitor):
         * declarations -> Assign, FunctionDef.args.args
         * import statements -> Import.names.alias and ImportFrom.names.alias
         * reference -> Name class
+
+    REPRESENTATION:
+    the graph is stored in a compact form: scopes are identified by integers (the global scope is 0), with a parent array
+    and a scope-kind array, while names are interned in a symbol table. The declarations and references of each scope are
+    packed arrays of (symbol, line) pairs. The dictionary representation is still available through get_graph().
+    While visiting, the builder also records for each scope its depth, number of children, function-nesting depth and
+    nearest enclosing function, so that the structural features don't need to walk the graph again.
+    Finally, the builder keeps an inverted index symbol -> occurrences (scope, line, usage), the set of the (scope,
+    symbol, usage) triples and an index of the import references, so that name lookups don't scan the whole graph.
     """
+    __SCOPE_KINDS: dict[type, ScopeKind] = {ast.FunctionDef: ScopeKind.FUNC,
+                                            ast.AsyncFunctionDef: ScopeKind.AFUNC,
+                                            ast.Lambda: ScopeKind.LAMBDA,
+                                            ast.ClassDef: ScopeKind.CLASS,
+                                            ast.ListComp: ScopeKind.LSTCOMP,
+                                            ast.ExceptHandler: ScopeKind.EXCHANDLER}
+    __DECLARED_KINDS: dict[ScopeKind, SymbolKind] = {ScopeKind.FUNC: SymbolKind.FUNC,
+                                                     ScopeKind.AFUNC: SymbolKind.AFUNC,
+                                                     ScopeKind.CLASS: SymbolKind.CLASS}
 
     def __init__(self) -> None:
-        self.__scope_stack: list[str] = ["s0__main__"] # global scope
-        self.__graph: dict = {"s0__main__": {"decls": set(), "refs": set(), "parent": None, "have-children": False}}
-        self.__next_id: int = 1
+        self.__symbols: SymbolTable = SymbolTable()
+        self.__parents: array = array("i", [-1])
+        self.__kinds: array = array("B", [ScopeKind.MODULE])
+        self.__scope_names: list[str | None] = [None] # name of the node generating the scope (if any)
+        self.__depths: array = array("I", [0]) # number of jumps to reach the global scope
+        self.__children_numbers: array = array("I", [0])
+        self.__function_depths: array = array("I", [0]) # number of function scopes in the chain from the scope to the global one
+        self.__enclosing_functions: array = array("i", [-1]) # nearest function scope in the chain (the scope itself included)
+        self.__max_depth: int = 0
+        self.__decls: list[array] = [array("I")] # packed (symbol, line) pairs
+        self.__refs: list[array] = [array("I")] # packed (symbol, line) pairs
+        self.__occurrences: dict[int, array] = {} # symbol -> packed (scope, line, usage) triples
+        self.__scope_symbols: set[int] = set() # (scope, symbol, usage) triples packed in a single integer
+        self.__import_refs: array = array("I") # packed (scope, symbol, line) triples
         self.__variables_values: dict = {} #save the values of the variables, useful to evaluate
+        # scopes, symbols and variable values in order of addition, recorded only to export segments (see get_mark)
+        self.__events: list[tuple] | None = None
 
-    def get_graph(self) -> dict:
+    def get_graph(self) -> ScopeGraphView:
         """
-        :return: data structure containing the representation of the scope graph
+        :return: dictionary view of the scope graph
         """
-        return self.__graph
+        return ScopeGraphView(self)
 
     def get_variables_values(self) -> dict:
         return self.__variables_values
 
-    def __current_scope(self) -> str:
+    def get_symbols(self) -> SymbolTable:
+        return self.__symbols
+
+    def get_scopes_number(self) -> int:
+        return len(self.__parents)
+
+    def get_parent(self, scope: int) -> int | None:
         """
-        :return: current scope name
+        :param scope: scope identifier
+        :return: identifier of the parent scope, None for the global scope
         """
-        return self.__scope_stack[-1]
-
-    def __get_parent_scope(self) -> str | None:
-        return self.__scope_stack[-2] if len(self.__scope_stack) > 1 else None
+        parent = self.__parents[scope]
 
-    def __add_refs(self, node: ast.FunctionDef | ast.AsyncFunctionDef | ast.Lambda | ast.ClassDef | ast.ListComp | ast.ExceptHandler | ast.Assign | ast.Name | ast.Import | ast.ImportFrom, name: str) -> None:
-        elem: tuple[str, int] = (name, node.lineno)
+        return None if parent < 0 else parent
 
-        self.__graph[self.__current_scope()]["refs"].add(elem)
+    def get_kind(self, scope: int) -> ScopeKind:
+        return ScopeKind(self.__kinds[scope])
 
-    def __add_decls(self, node: ast.FunctionDef | ast.AsyncFunctionDef | ast.Lambda | ast.ClassDef | ast.ListComp | ast.ExceptHandler | ast.Assign, name: str) -> None:
-        elem: tuple[str, int] = (name, node.lineno)
+    def has_children(self, scope: int) -> bool:
+        return self.__children_numbers[scope] > 0
 
-        self.__graph[self.__current_scope()]["decls"].add(elem)
+    def get_children_number(self, scope: int) -> int:
+        return self.__children_numbers[scope]
 
-    def get_declaration_scopes(self, decl_name: str) -> list[str]:
+    def get_depth(self, scope: int) -> int:
         """
-        Get the list of scopes in which the declaration occurred
+        :param scope: scope identifier
+        :return: number of jumps needed to reach the global scope (0 for the global scope)
+        """
+        return self.__depths[scope]
 
-        :param decl_name: declaration name to search
-        :return: list of scopes
+    def get_function_depth(self, scope: int) -> int:
+        """
+        :param scope: scope identifier
+        :return: number of scopes generated by a function (sync or async) in the chain from the scope to the global scope
         """
-        scopes = []
+        return self.__function_depths[scope]
 
-        for scope in self.__graph.keys():
-            if decl_name in self.__graph[scope]["decls"][0]:
-                scopes.append(scope)
+    def get_enclosing_function(self, scope: int) -> int | None:
+        """
+        :param scope: scope identifier
+        :return: nearest scope generated by a function in the chain from the scope (included) to the global scope, None if
+        there isn't any
+        """
+        function = self.__enclosing_functions[scope]
 
-        return scopes
+        return None if function < 0 else function
 
-    def get_leaf_scopes(self) -> list:
+    def get_scope_name(self, scope: int) -> str:
         """
-        Get a list of scopes that have no children
-        :return: list of scopes with no children
+        :param scope: scope identifier
+        :return: name of the scope (e.g., s12_func_name)
         """
-        return list([scope for scope in self.__graph.keys() if not self.__graph[scope]["have-children"]])
+        kind = ScopeKind(self.__kinds[scope])
 
-    def length_longest_scope_chain(self) -> int:
+        if kind == ScopeKind.MODULE:
+            return f"s{scope}__main__"
+        if self.__scope_names[scope] is None:
+            return f"s{scope}_{kind.prefix}"
+        return f"s{scope}_{kind.prefix}_{self.__scope_names[scope]}"
+
+    @staticmethod
+    def get_scope_id(scope_name: str) -> int:
         """
-        Function to calculate the length of the longest scope chain.
+        :param scope_name: name of the scope (e.g., s12_func_name)
+        :return: scope identifier
+        :raises: ValueError if the name is not a scope name
+        """
+        return int(scope_name[1:].split("_", 1)[0])
 
-        ALGORITHM:
-        * start from a leaf scope;
-        * walk up the scope graph until the global scope is reached, incrementing the length of the scope chain;
-        * return the maximum length of the scope chain.
+    def get_decls(self, scope: int) -> array:
+        """
+        :param scope: scope identifier
+        :return: packed array of the scope's declarations, (symbol, line) pairs are stored one after the other
+        """
+        return self.__decls[scope]
 
-        :return: length of the longest scope chain
+    def get_refs(self, scope: int) -> array:
+        """
+        :param scope: scope identifier
+        :return: packed array of the scope's references, (symbol, line) pairs are stored one after the other
         """
-        length = 0
+        return self.__refs[scope]
 
-        for leaf in self.get_leaf_scopes():
-            scope = leaf
-            jump = 0 # count the number of jumps made from leaf to global scope
+    def iter_decls(self, scope: int) -> Iterator[tuple[int, int]]:
+        decls = self.__decls[scope]
 
-            while not self.__graph[scope]["parent"] is None:
-                jump += 1
-                scope = self.__graph[scope]["parent"]
+        return zip(decls[0::2], decls[1::2])
 
-            length = max(length, jump + 1) # update the length of the longest scope chain
+    def iter_refs(self, scope: int) -> Iterator[tuple[int, int]]:
+        refs = self.__refs[scope]
 
-        return length
+        return zip(refs[0::2], refs[1::2])
 
-    def __init_scope(self, id: str) -> None:
-        self.__graph[id] = {"decls": set(), "refs": set(), "parent": None, "have-children": False}
+    @staticmethod
+    def __pack(scope: int, symbol: int, usage: Usage) -> int:
+        return (scope << 33) | (symbol << 1) | usage
 
-    def __build_local_scope(self, node: ast.FunctionDef | ast.AsyncFunctionDef | ast.Lambda | ast.ClassDef | ast.ListComp | ast.ExceptHandler) -> None:
-        def get_node_type(node: ast.FunctionDef | ast.AsyncFunctionDef | ast.Lambda | ast.ClassDef | ast.ListComp | ast.ExceptHandler) -> tuple[str, str]:
-            if isinstance(node, ast.FunctionDef):
-                visit_type = "func"
-                sid = f"s{self.__next_id}_{visit_type}_{node.name}"
-            elif isinstance(node, ast.AsyncFunctionDef):
-                visit_type = "afunc"
-                sid = f"s{self.__next_id}_{visit_type}_{node.name}"
-            elif isinstance(node, ast.Lambda):
-                visit_type = "lambda"
-                sid = f"s{self.__next_id}_{visit_type}"
-            elif isinstance(node, ast.ClassDef):
-                visit_type = "class"
-                sid = f"s{self.__next_id}_{visit_type}_{node.name}"
-            elif isinstance(node, ast.ListComp):
-                visit_type = "lstComp"
-                sid = f"s{self.__next_id}_{visit_type}"
-            elif isinstance(node, ast.ExceptHandler):
-                visit_type = "excHandler"
-                sid = f"s{self.__next_id}_{visit_type}"
+    def __add_symbol(self, elems: array, scope: int, line: int, kind: SymbolKind, name: str, usage: Usage) -> None:
+        symbol = self.__symbols.intern(kind, name)
 
-            return visit_type, sid
+        elems.append(symbol)
+        elems.append(line)
 
-        visit_type, sid = get_node_type(node)
+        # inverted indexes
+        if (occurrences := self.__occurrences.get(symbol)) is None:
+            occurrences = self.__occurrences[symbol] = array("I")
 
-        self.__init_scope(sid)
+        occurrences.extend((scope, line, usage))
+        self.__scope_symbols.add(self.__pack(scope, symbol, usage))
 
-        self.__next_id += 1
+        if kind == SymbolKind.IMPORT and usage == Usage.REFERENCE:
+            self.__import_refs.extend((scope, symbol, line))
 
-        if visit_type not in ["lambda", "lstComp", "excHandler"]:
-            self.__add_decls(node, f"{visit_type}_{node.name}")
-            #self.__graph[self.__current_scope()]["decls"].add(f"{visit_type}_{node.name}")
+        if self.__events is not None:
+            self.__events.append(("symbol", scope, kind, name, line, usage))
 
-        self.__graph[self.__current_scope()]["have-children"] = True
+    def __add_refs(self, scope: int, node: ast.Name | ast.Import | ast.ImportFrom, kind: SymbolKind, name: str) -> None:
+        self.__add_symbol(self.__refs[scope], scope, node.lineno, kind, name, Usage.REFERENCE)
 
-        self.__scope_stack.append(sid)
+    def __add_decls(self, scope: int, node: ast.FunctionDef | ast.AsyncFunctionDef | ast.Lambda | ast.ClassDef | ast.ListComp | ast.ExceptHandler | ast.Assign, kind: SymbolKind, name: str) -> None:
+        self.__add_symbol(self.__decls[scope], scope, node.lineno, kind, name, Usage.DECLARATION)
 
-        if (parent := self.__get_parent_scope()) is not None:
-            self.__graph[self.__current_scope()]["parent"] = parent
+    def get_occurrences(self, symbol: int) -> list[tuple[int, int, Usage]]:
+        """
+        :param symbol: identifier of the symbol
+        :return: list of the symbol's occurrences as (scope, line, usage) triples, in visiting order
+        """
+        occurrences = self.__occurrences.get(symbol, array("I"))
 
-        if visit_type not in ["class", "lstComp", "excHandler"]:
-            for arg in node.args.args:
-                self.__add_decls(node, f"var_{arg.arg}")
-                #self.__graph[sid]["decls"].add(f"var_{arg.arg}")
+        return [(scope, line, Usage(usage)) for scope, line, usage in zip(occurrences[0::3], occurrences[1::3], occurrences[2::3])]
 
-        if visit_type == "excHandler" and node.name is not None:
-            self.__add_decls(node, f"exp_{node.name}")
-            #self.__graph[sid]["decls"].add(f"exp_{node.name}")
+    def is_declared(self, scope: int, kind: SymbolKind, name: str) -> bool:
+        """
+        :return: True if the scope contains a declaration of the symbol, False otherwise
+        """
+        return (symbol := self.__symbols.lookup(kind, name)) is not None and self.__pack(scope, symbol, Usage.DECLARATION) in self.__scope_symbols
 
-        self.generic_visit(node)
-        self.__scope_stack.pop()
+    def is_referenced(self, scope: int, kind: SymbolKind, name: str) -> bool:
+        """
+        :return: True if the scope contains a reference to the symbol, False otherwise
+        """
+        return (symbol := self.__symbols.lookup(kind, name)) is not None and self.__pack(scope, symbol, Usage.REFERENCE) in self.__scope_symbols
 
-    def visit_FunctionDef(self, node:ast.FunctionDef) -> None:
-        self.__build_local_scope(node)
+    def get_import_refs(self) -> list[tuple[int, int, int]]:
+        """
+        :return: list of the references to imports as (scope, symbol, line) triples, in visiting order
+        """
+        return list(zip(self.__import_refs[0::3], self.__import_refs[1::3], self.__import_refs[2::3]))
 
-    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
-        self.__build_local_scope(node)
+    def get_import_scopes(self) -> list[int]:
+        """
+        :return: sorted list of the scopes containing at least a reference to an import
+        """
+        return sorted(set(self.__import_refs[0::3]))
 
-    def visit_Lambda(self, node: ast.Lambda) -> None:
-        self.__build_local_scope(node)
+    def get_declaration_scopes(self, decl_name: str) -> list[int]:
+        """
+        Get the list of scopes in which the declaration occurred
 
-    def visit_ClassDef(self, node: ast.ClassDef) -> None:
-        self.__build_local_scope(node)
+        :param decl_name: declaration name to search (with the prefix of its kind, e.g., var_name)
+        :return: list of scopes
+        """
+        if (symbol := self.__symbols.lookup_formatted(decl_name)) is None:
+            return []
 
-    def visit_ListComp(self, node: ast.ListComp) -> None:
-        self.__build_local_scope(node)
+        return sorted({scope for scope, _, usage in self.get_occurrences(symbol) if usage == Usage.DECLARATION})
 
-    def visit_ExceptHandler(self, node: ast.ExceptHandler) -> None:
-        self.__build_local_scope(node)
+    def get_leaf_scopes(self) -> list[int]:
+        """
+        Get a list of scopes that have no children
+        :return: list of scopes with no children
+        """
+        return [scope for scope in range(self.get_scopes_number()) if self.__children_numbers[scope] == 0]
+
+    def length_longest_scope_chain(self) -> int:
+        """
+        Function to calculate the length of the longest scope chain.
+        The deepest scope is tracked while building the graph, so the length is the number of jumps from such a scope to
+        the global scope plus one.
+
+        :return: length of the longest scope chain
+        """
+        return self.__max_depth + 1
+
+    def __init_scope(self, kind: ScopeKind, name: str | None, parent: int) -> int:
+        scope = len(self.__parents)
+        is_function = kind in [ScopeKind.FUNC, ScopeKind.AFUNC]
+
+        self.__parents.append(parent)
+        self.__kinds.append(kind)
+        self.__scope_names.append(None if name is None else sys.intern(name))
+        self.__decls.append(array("I"))
+        self.__refs.append(array("I"))
+
+        # structural features, derived from the parent
+        self.__children_numbers.append(0)
+        self.__children_numbers[parent] += 1
+        self.__depths.append(depth := self.__depths[parent] + 1)
+        self.__function_depths.append(self.__function_depths[parent] + int(is_function))
+        self.__enclosing_functions.append(scope if is_function else self.__enclosing_functions[parent])
+        self.__max_depth = max(self.__max_depth, depth)
+
+        if self.__events is not None:
+            self.__events.append(("scope", kind, name, parent))
+
+        return scope
+
+    def get_callbacks(self) -> dict[type, Callable[[ast.AST, ScopeContext], None]]:
+        return {ast.FunctionDef: self.__declare_local_scope,
+                ast.AsyncFunctionDef: self.__declare_local_scope,
+                ast.ClassDef: self.__declare_local_scope,
+                ast.Assign: self.__visit_assign,
+                ast.Name: self.__visit_name,
+                ast.Import: self.__import_visit,
+                ast.ImportFrom: self.__import_visit}
+
+    def __declare_local_scope(self, node: ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef, context: ScopeContext) -> None:
+        # functions and classes are declared in the enclosing scope
+        self.__add_decls(context.current_scope(), node, self.__DECLARED_KINDS[self.__SCOPE_KINDS[type(node)]], node.name)
+
+    def enter_scope(self, node: ast.FunctionDef | ast.AsyncFunctionDef | ast.Lambda | ast.ClassDef | ast.ListComp | ast.ExceptHandler, context: ScopeContext) -> None:
+        kind = self.__SCOPE_KINDS[type(node)]
+        sid = self.__init_scope(kind, node.name if kind in self.__DECLARED_KINDS else None, context.parent_scope())
+
+        if kind not in [ScopeKind.CLASS, ScopeKind.LSTCOMP, ScopeKind.EXCHANDLER]:
+            for arg in node.args.args:
+                self.__add_decls(sid, node, SymbolKind.VAR, arg.arg)
+
+        if kind == ScopeKind.EXCHANDLER and node.name is not None:
+            self.__add_decls(sid, node, SymbolKind.EXP, node.name)
 
-    def visit_Assign(self, node: ast.Assign) -> None:
+    def __visit_assign(self, node: ast.Assign, context: ScopeContext) -> None:
         for t in node.targets:
             if isinstance(t, ast.Name):
-                self.__add_decls(node, f"var_{t.id}")
-                #self.__graph[self.__current_scope()]["decls"].add(f"var_{t.id}")
+                self.__add_decls(context.current_scope(), node, SymbolKind.VAR, t.id)
 
-                if t.id not in self.__variables_values.keys():
-                    self.__variables_values[f"{t.id}"] = list()
-                self.__variables_values[f"{t.id}"].append(node.value)
-        self.generic_visit(node)
+                self.__add_variable_value(t.id, node.value)
 
-    def visit_Name(self, node: ast.Name) -> None:
+    def __add_variable_value(self, name: str, value: ast.expr) -> None:
+        if name not in self.__variables_values.keys():
+            self.__variables_values[f"{name}"] = list()
+        self.__variables_values[f"{name}"].append(value)
+
+        if self.__events is not None:
+            self.__events.append(("value", name, value))
+
+    def __visit_name(self, node: ast.Name, context: ScopeContext) -> None:
         if isinstance(node.ctx, ast.Load):
-            self.__add_refs(node, f"var_{node.id}")
-            #self.__graph[self.__current_scope()]["refs"].add(f"var_{node.id}")
-        self.generic_visit(node)
+            self.__add_refs(context.current_scope(), node, SymbolKind.VAR, node.id)
 
-    def __import_visit(self, node: ast.Import | ast.ImportFrom) -> None:
+    def __import_visit(self, node: ast.Import | ast.ImportFrom, context: ScopeContext) -> None:
         for pkg in node.names:
             if isinstance(pkg, ast.alias):
                 if pkg.asname is None:
-                    self.__add_refs(node, f"import_{pkg.name}")
-                    #self.__graph[self.__current_scope()]["refs"].add(f"import_{pkg.name}")
+                    self.__add_refs(context.current_scope(), node, SymbolKind.IMPORT, pkg.name)
                 else:
-                    self.__add_refs(node, f"import_{pkg.asname}")
-                    #self.__graph[self.__current_scope()]["refs"].add(f"import_{pkg.asname}")
-        self.generic_visit(node)
+                    self.__add_refs(context.current_scope(), node, SymbolKind.IMPORT, pkg.asname)
 
-    def visit_Import(self, node: ast.Import) -> None:
-        self.__import_visit(node)
+    def get_mark(self) -> int:
+        """
+        :return: number of events (scopes, symbols and variable values added) recorded so far
+        """
+        if self.__events is None:
+            self.__events = [] # the graph is built statement by statement: from now on the events are recorded
+
+        return len(self.__events)
+
+    def export_segment(self, mark: int, first_scope: int) -> tuple[int, list[tuple]]:
+        """
+        :param mark: number of events before visiting the statement (see get_mark)
+        :param first_scope: identifier of the first scope generated by the statement
+        :return: first scope and events of the statement
+        """
+        return first_scope, self.__events[mark:]
+
+    def import_segment(self, segment: tuple[int, list[tuple]], line_offset: int, first_scope: int, context: ScopeContext) -> None:
+        """
+        Add the scopes, the symbols and the variable values of a statement in the same order of its visit.
 
-    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
-        self.__import_visit(node)
+        :param segment: first scope and events of the statement (see export_segment)
+        :param line_offset: offset to add to the line numbers of the events
+        :param first_scope: identifier of the first scope generated by the statement
+        :param context: scope context of the traversal
+        """
+        segment_first_scope, events = segment
+        scope_offset = first_scope - segment_first_scope
+        # the statement won't be exported again (its segment is reused as it is), so the events aren't recorded
+        recorded_events, self.__events = self.__events, None
+
+        try:
+            for event in events:
+                if event[0] == "scope":
+                    _, kind, name, parent = event
+                    self.__init_scope(kind, name, 0 if parent == 0 else parent + scope_offset)
+                elif event[0] == "symbol":
+                    _, scope, kind, name, line, usage = event
+                    scope = 0 if scope == 0 else scope + scope_offset
+                    self.__add_symbol(self.__decls[scope] if usage == Usage.DECLARATION else self.__refs[scope], scope, line + line_offset, kind, name, usage)
+                else:
+                    _, name, value = event
+                    self.__add_variable_value(name, value)
+        finally:
+            self.__events = recorded_events
+
+    def visit(self, tree: ast.AST) -> None:
+        """
+        Build the scope graph with a traversal of the AST that has the scope graph as the only plugin.
+        To share the traversal with other plugins, add the scope graph to an ASTTraversal instead.
+
+        :param tree: AST to visit
+        """
+        ASTTraversal([self]).run(tree)
 
     def draw(self, name: str) -> None:
         """
@@ -226,35 +543,33 @@ class ScopeGraph(ast.NodeVisitor):
         """
 
         graph = graphviz.Digraph()
-        scopes = self.__graph.keys()
+        scopes = range(self.get_scopes_number())
 
         # adding nodes to the graph
         for scope in scopes:
-            graph.node(scope)
+            graph.node(self.get_scope_name(scope))
 
         # add parent edges
         for scope in scopes:
-            parent = self.__graph[scope]["parent"]
+            parent = self.get_parent(scope)
 
             if parent is not None:
-                graph.edge(scope, parent)
+                graph.edge(self.get_scope_name(scope), self.get_scope_name(parent))
 
         # adding declaration edges
         for scope in scopes:
-            decls = self.__graph[scope]["decls"]
-            scope_prefix = scope.split("_")[0]
+            scope_name = self.get_scope_name(scope)
 
-            for decl in decls:
-                graph.node(f"{scope_prefix}_decl_{decl[0]}", shape="box")
-                graph.edge(f"{scope_prefix}_decl_{decl[0]}", scope)
+            for symbol, _ in self.iter_decls(scope):
+                graph.node(f"s{scope}_decl_{self.__symbols.format(symbol)}", shape="box")
+                graph.edge(f"s{scope}_decl_{self.__symbols.format(symbol)}", scope_name)
 
         # adding reference edges
         for scope in scopes:
-            refs = self.__graph[scope]["refs"]
-            scope_prefix = scope.split("_")[0]
+            scope_name = self.get_scope_name(scope)
 
-            for ref in refs:
-                graph.node(f"{scope_prefix}_ref_{ref[0]}", shape="box")
-                graph.edge(scope, f"{scope_prefix}_ref_{ref[0]}")
+            for symbol, _ in self.iter_refs(scope):
+                graph.node(f"s{scope}_ref_{self.__symbols.format(symbol)}", shape="box")
+                graph.edge(scope_name, f"s{scope}_ref_{self.__symbols.format(symbol)}")
 
         graph.render(f"scope-graphs/{name}.gv").replace('\\', '/')
@@ -0,0 +1,104 @@
+import ast
+import bisect
+
+class ScopeSegments:
+    """
+    Top-level statements (segments) of the last analyzed version of a module, each one with what the traversal plugins
+    (scope graph, AST heuristics) recorded while visiting it, to analyze the next version incrementally.
+
+    Given the hunks of the diff between the two versions, a top-level statement of the new version whose lines are all
+    unchanged is found in the segments at its old position: the plugins import its segment (shifting the line numbers)
+    instead of visiting its subtree, so only the statements touched by the diff are visited. A top-level statement
+    parses the same wherever it is in the module, hence the result is the same of a complete visit.
+    """
+    def __init__(self) -> None:
+        # span -> (number of scopes, segments of the plugins, line offset), None if the span isn't a single statement
+        self.__segments: dict[tuple[int, int], tuple[int, list, int] | None] = {}
+        self.__hunks: list[dict] | None = None # hunks from the analyzed version to the next one, None if unknown
+        self.__added_lines: list[int] = [] # sorted lines of the next version added by the hunks
+
+    @staticmethod
+    def get_span(stmt: ast.stmt) -> tuple[int, int]:
+        """
+        :param stmt: top-level statement
+        :return: first and last line of the statement, decorators included
+        """
+        start = min([stmt.lineno] + [decorator.lineno for decorator in getattr(stmt, "decorator_list", [])])
+
+        return start, stmt.end_lineno
+
+    def set_changes(self, hunks: list[dict] | None) -> None:
+        """
+        Set the changes between the analyzed version and the next one to analyze.
+
+        :param hunks: hunks of the diff between the versions (see GitLogParser.get_commit_hunks), None if unknown (no
+                      segment will be reused)
+        """
+        self.__hunks = hunks
+        self.__added_lines = [] if hunks is None else sorted(new for hunk in hunks for old, new in hunk["lines"] if old is None)
+
+    def reset(self) -> None:
+        """
+        Forget the segments (e.g., the next version to analyze doesn't follow the analyzed one).
+        """
+        self.__segments = {}
+        self.__hunks = None
+        self.__added_lines = []
+
+    def __map_line(self, line: int) -> int | None:
+        """
+        :param line: line number in the new version
+        :return: line number in the analyzed version, None if the line has been added
+        """
+        offset = 0 # lines added minus lines removed by the hunks before the line
+
+        for hunk in self.__hunks:
+            # a hunk without new lines removes the lines after new_start
+            hunk_end = hunk["new_start"] + hunk["new_lines"] - 1 if hunk["new_lines"] > 0 else hunk["new_start"]
+
+            if line < hunk["new_start"] or (hunk["new_lines"] == 0 and line == hunk["new_start"]):
+                break
+
+            if line <= hunk_end:
+                for old, new in hunk["lines"]:
+                    if new == line:
+                        return old
+
+            offset += hunk["new_lines"] - hunk["old_lines"]
+
+        return line - offset
+
+    def get(self, span: tuple[int, int]) -> tuple[int, list, int] | None:
+        """
+        :param span: first and last line of a top-level statement of the new version
+        :return: (number of scopes, segments of the plugins, line offset) of the statement, None if the statement has to
+        be visited (some of its lines are new or changed)
+        """
+        if self.__hunks is None:
+            return None
+
+        start, end = span
+
+        # no added line in the span and the same distance between the first and the last line: no line removed either
+        if bisect.bisect_left(self.__added_lines, start) < bisect.bisect_right(self.__added_lines, end):
+            return None
+
+        if (old_start := self.__map_line(start)) is None or (old_end := self.__map_line(end)) is None or not old_end - old_start == end - start:
+            return None
+
+        if (segment := self.__segments.get((old_start, old_end))) is None:
+            return None
+
+        scopes_number, plugin_segments, line_offset = segment
+
+        return scopes_number, plugin_segments, line_offset + start - old_start
+
+    def update(self, segments: dict[tuple[int, int], tuple[int, list, int] | None]) -> None:
+        """
+        Replace the segments with the ones of the version just analyzed.
+
+        :param segments: span -> (number of scopes, segments of the plugins, line offset)
+        """
+        self.__segments = segments
+        self.__hunks = None
+        self.__added_lines = []
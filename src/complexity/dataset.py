@@ -1,3 +1,4 @@
+import argparse
 import os
 import pathlib
 import random
@@ -5,9 +6,7 @@ import shutil
 import subprocess
 import sys
 import json
-import ast
 import pandas as pd
-import tokenize # use it to respect PEP 263 encoding declaration and handle non-UTF-8 files robustly
 
 from tqdm import tqdm
 
@@ -15,25 +14,33 @@ from radon.raw import analyze
 from radon.complexity import cc_visit
 from radon.visitors import Function, Class
 
+from classes.artifact_store import ArtifactStore
+from classes.index_server import IndexServer
+from classes.parsed_source import ParsedSource # respects PEP 263 encoding declaration and handles non-UTF-8 files robustly
+from classes.result_cache import ResultCache
 from classes.scope_graphv2 import ScopeGraph
 
-from utils.utils import get_version
+from utils.utils import get_pypi_client, resolve_packages, set_offline
 
 OUTPUT_DIR: str = "../../data/complexity"
 TMP_ENV: str = "./tmp/" # CHANGE if you want to have different name for environment
 PACKAGES_PATH: str = f"{TMP_ENV}/lib/python3.13/site-packages"
 TOP_PKGS_PATH: str = "../../data/results"
+HEURISTICS_DIR: str = "../classes/heuristics"
+RESULT_CACHE_DIR: str = "../cache/results" # same cache of data_extraction.py
+ARTIFACT_STORE_DIR: str = "../cache/artifacts" # same store of data_extraction.py
 NUM_PKGS: int = 500 # for having 95% of confidence level with 5% of error (should be at least 365 package to reach such leve of confidence)
 
 # NOTE: we need to download the package twice: when we want to analyze its dependencies and from the other case because there is some case where the package has different name inside the environment and the script doesn't find it
 
-def get_dependencies_infos(pkg_name: str, version: int) -> tuple[int, int]:
+def get_dependencies_infos(pkg_name: str, version: int, index_url: str) -> tuple[int, int]:
     try:
         subprocess.run(
             [sys.executable, "-m", "pip", "install",
              "-t", f"{PACKAGES_PATH}",
              "-q",
              "--no-cache-dir",
+             "--index-url", index_url, # artifacts are served by the local store
              "--upgrade",
              "--disable-pip-version-check",
              f"{pkg}<={version}"],
@@ -93,17 +100,21 @@ def get_cyclomatic_complexity(code: str) -> int:
 
         return 0
 
-def get_max_scope_nesting(code: str) -> int:
+def get_max_scope_nesting(source: ParsedSource, result_cache: ResultCache) -> int:
     try:
-        tree = ast.parse(code)
+        # the length of the longest scope chain is part of the detector results, so a file already analyzed (by
+        # data_extraction.py) is not parsed again
+        if (result := result_cache.get(source.get_raw())) is not None:
+            return result["scope_chain_length"]
 
-        # building scope graph
+        # otherwise only the scope graph is built: YARA and the shadowing detection aren't needed for this metric (and
+        # the cache keeps only complete detector results)
         scope_graph = ScopeGraph()
-        scope_graph.visit(tree)
+        scope_graph.visit(source.get_tree())
 
         return scope_graph.length_longest_scope_chain()
     except Exception as e:
-        print(f"Error parsing the code: {e}")
+        print(f"Scope nesting error: {e}")
 
         return 0
 
@@ -159,82 +170,100 @@ def remove_package(pkg_name: str) -> None:
 
 
 if __name__ == "__main__":
-    # dataset structure
-    data = {
-        'package': [],
-        'file': [],
-        'year': [],
-        'lloc': [],
-        'cyclomatic_complexity': [],
-        'max_scope_nesting_level': [],
-        'total_dependencies': [],
-        'max_dependencies_depth': []
-    }
-
-    for file in os.listdir(TOP_PKGS_PATH):
-        # create temporary environment if needed
-        if not os.path.exists(TMP_ENV):
-            try:
-                subprocess.run(["python3", "-m", "venv", TMP_ENV], check=False)
-            except subprocess.CalledProcessError as e:
-                print(e)
-                sys.exit()# create temporary environment if needed
-
-        res = json.load(open(f"{TOP_PKGS_PATH}/{file}"))
-
-        pkgs_list = random.sample([key for key in res.keys() if not res[key] == "unavailable"], NUM_PKGS)
-        year = int(file.split("_")[-1][: -5])
-
-        del res
-
-        for pkg in tqdm(pkgs_list, desc=f"Packages analysis({file})"):
-            version = get_version(year, pkg)
-
-            # download package
-            try:
-                # second download of the package in a directory with the same name of the package to cope with the case in which the package has different name inside the environment
-                subprocess.run(
-                    [sys.executable, "-m", "pip", "install",
-                     "-t", f"{PACKAGES_PATH}/{pkg}",
-                     "-q",
-                     "--no-cache-dir",
-                     "--no-deps",
-                     "--upgrade",
-                     "--disable-pip-version-check",
-                     f"{pkg}<={year}"],
-                    check=False  # don't rise on failure, your existing try/except handles it
-                )
-            except (subprocess.CalledProcessError, KeyError, Exception) as e:
-                print(f"PIP error: {e}")
-
-                data = default_entry(data, pkg, year)
+    parser = argparse.ArgumentParser(description="Build the complexity dataset of a sample of the top packages")
+    parser.add_argument("--offline", action="store_true", help="serve metadata and packages only from the local caches")
+    args = parser.parse_args()
+
+    set_offline(args.offline)
+
+    # pip downloads go through a local index backed by the artifact store, so the artifacts are downloaded only once
+    # (the server is stopped even if the analysis fails or is interrupted)
+    with IndexServer(ArtifactStore(get_pypi_client(), ARTIFACT_STORE_DIR)) as index_server:
+        # dataset structure
+        data = {
+            'package': [],
+            'file': [],
+            'year': [],
+            'lloc': [],
+            'cyclomatic_complexity': [],
+            'max_scope_nesting_level': [],
+            'total_dependencies': [],
+            'max_dependencies_depth': []
+        }
+
+        versions = {} # package -> year -> version
+        result_cache = ResultCache(HEURISTICS_DIR, RESULT_CACHE_DIR)
+
+        for file in os.listdir(TOP_PKGS_PATH):
+            # create temporary environment if needed
+            if not os.path.exists(TMP_ENV):
+                try:
+                    subprocess.run(["python3", "-m", "venv", TMP_ENV], check=False)
+                except subprocess.CalledProcessError as e:
+                    print(e)
+                    sys.exit()# create temporary environment if needed
+
+            res = json.load(open(f"{TOP_PKGS_PATH}/{file}"))
+
+            pkgs_list = random.sample([key for key in res.keys() if not res[key] == "unavailable"], NUM_PKGS)
+            year = int(file.split("_")[-1][: -5])
+
+            del res
+
+            # each package is resolved for all the years the first time it is sampled
+            versions.update(resolve_packages([pkg for pkg in pkgs_list if pkg not in versions]))
+
+            for pkg in tqdm(pkgs_list, desc=f"Packages analysis({file})"):
+                version = versions[pkg][year]
+
+                # download package
+                try:
+                    # second download of the package in a directory with the same name of the package to cope with the case in which the package has different name inside the environment
+                    subprocess.run(
+                        [sys.executable, "-m", "pip", "install",
+                         "-t", f"{PACKAGES_PATH}/{pkg}",
+                         "-q",
+                         "--no-cache-dir",
+                         "--index-url", index_server.get_simple_url(),
+                         "--no-deps",
+                         "--upgrade",
+                         "--disable-pip-version-check",
+                         f"{pkg}<={year}"],
+                        check=False  # don't rise on failure, your existing try/except handles it
+                    )
+                except (subprocess.CalledProcessError, KeyError, Exception) as e:
+                    print(f"PIP error: {e}")
 
-                continue
-            else:
-                deps_num, deptree_depth = get_dependencies_infos(pkg, year)
-
-                # handles cases in which the package is not available, so pipdeptree fails to build the dependency tree
-                if deps_num == -1 and deptree_depth == -1:
                     data = default_entry(data, pkg, year)
 
                     continue
+                else:
+                    deps_num, deptree_depth = get_dependencies_infos(pkg, year, index_server.get_simple_url())
+
+                    # handles cases in which the package is not available, so pipdeptree fails to build the dependency tree
+                    if deps_num == -1 and deptree_depth == -1:
+                        data = default_entry(data, pkg, year)
+
+                        continue
+
+                    for py_file in pathlib.Path(f"{PACKAGES_PATH}/{pkg}").glob("**/*.py"):  # takes only python files in all possible directories
+                        source = ParsedSource.from_path(str(py_file)) # file read and decoded once for all the metrics
+
+                        data["package"].append(pkg)
+                        data["file"].append(f"./{'/'.join(str(py_file).split('/')[5:])}")
+                        data["year"].append(year)
+                        data["lloc"].append(get_lloc(source.get_code()))
+                        data["cyclomatic_complexity"].append(get_cyclomatic_complexity(source.get_code()))
+                        data["max_scope_nesting_level"].append(get_max_scope_nesting(source, result_cache))
+                        data["total_dependencies"].append(deps_num)
+                        data["max_dependencies_depth"].append(deptree_depth)
+
+                    shutil.rmtree(f"{PACKAGES_PATH}/{pkg}", ignore_errors=True)
+                finally:
+                    remove_package(pkg)
+
+            # save dataset
+            pd.DataFrame(data).to_csv(f"{OUTPUT_DIR}/complexity.csv", index=False)
 
-                for py_file in pathlib.Path(f"{PACKAGES_PATH}/{pkg}").glob("**/*.py"):  # takes only python files in all possible directories
-                    data["package"].append(pkg)
-                    data["file"].append(f"./{'/'.join(str(py_file).split('/')[5:])}")
-                    data["year"].append(year)
-                    data["lloc"].append(get_lloc(tokenize.open(py_file).read()))
-                    data["cyclomatic_complexity"].append(get_cyclomatic_complexity(tokenize.open(py_file).read()))
-                    data["max_scope_nesting_level"].append(get_max_scope_nesting(tokenize.open(py_file).read()))
-                    data["total_dependencies"].append(deps_num)
-                    data["max_dependencies_depth"].append(deptree_depth)
-
-                shutil.rmtree(f"{PACKAGES_PATH}/{pkg}", ignore_errors=True)
-            finally:
-                remove_package(pkg)
-
-        # save dataset
-        pd.DataFrame(data).to_csv(f"{OUTPUT_DIR}/complexity.csv", index=False)
-
-        # deletion of temporary environment
-        shutil.rmtree(TMP_ENV, ignore_errors=True)
\ No newline at end of file
+            # deletion of temporary environment
+            shutil.rmtree(TMP_ENV, ignore_errors=True)
@@ -1,113 +1,271 @@
+import argparse
 import pathlib
 import shutil
-import json
 import os
 import pandas as pd
 import sys
 import requests
 import re
 import subprocess
+import threading
+import multiprocessing
 
 from tqdm import tqdm
 
-from classes.detector import Detector
+from classes.artifact_store import ArtifactStore
+from classes.package_fetcher import PackageFetcher
+from classes.package_summary import PackageSummary
+from classes.pipeline import Pipeline
+from classes.results_log import ResultsLog
+from classes.scan_worker import ScanWorker
 
-from utils.utils import get_version
+from utils.utils import get_pypi_client, resolve_versions, set_offline
 
 TEMP_DIR = "./tmp" # path to the temporary directory where the packages will be downloaded
 PKGS_DATA_DIR = "../data/top packages"  # path to the directory containing the top n packages names for each year
 RESULT_PATH_DIR = "../data/results"
-SAVE_FREQUENCY = 10 # how many packages will be analyzed before saving the results
 PYPI_API: str = "https://pypi.org/pypi/<package-name>/json"
 HEURISTICS_DIR: str = "./classes/heuristics"
+FILE_TIMEOUT_SECONDS: float = 60 # maximum time spent on the analysis of a single file
+FILE_MEMORY_LIMIT: int = 2 * 1024 ** 3 # maximum memory (bytes) used by the analysis of a single file
+RESULT_CACHE_DIR: str = "./cache/results" # path to the directory of the detector results cache (shared by the yearly runs)
+ARTIFACT_STORE_DIR: str = "./cache/artifacts" # path to the directory of the downloaded distribution files
+# concurrency limit of each stage of the pipeline
+RESOLVE_WORKERS: int = 8 # metadata requests
+FETCH_WORKERS: int = 8 # artifact downloads
+EXTRACT_WORKERS: int = 2 # wheel reading and pip installs (each pip install holds a temporary tree)
+SCAN_WORKERS: int = os.cpu_count() or 1 # scanner processes
+QUEUE_SIZE: int = 16 # maximum number of packages waiting for each stage
+# scanner processes are started by the scan threads: forking a multithreaded process is unsafe
+SCAN_START_METHOD: str | None = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
 
-sys.setrecursionlimit(3000) # increase recursion limit (NOTE: change with caution)
+def resolve_stage(task: dict, years: list[int], versions: dict, analyzed: dict) -> dict:
+    """
+    Version resolution: the versions of the package for all the years are resolved the first time the package is seen.
+    A version already analyzed (for another year) gets the stored statistics and skips the other stages.
+
+    :param task: package to analyze ({"package", "year"})
+    :param years: years of the lists
+    :param versions: package -> year -> version, shared by the yearly runs
+    :param analyzed: (package, version) -> statistics, shared by the yearly runs
+    :return: task with "version" (and "statistics" if the package has nothing left to analyze, "retry" if the
+    releases can't be retrieved now)
+    """
+    pkg_name = task["package"]
+
+    try:
+        if pkg_name not in versions:
+            # a failed request raises, so a transient failure is never stored as a package without releases
+            versions[pkg_name] = resolve_versions(get_pypi_client().get_releases(pkg_name, strict=True), years)
+    except Exception as e:
+        # the task still reaches the write stage (a failed item would be dropped), which doesn't log it: the package
+        # is retried by the next run
+        print(f"Error processing {pkg_name}: {e}")
+        task["version"], task["statistics"], task["retry"] = None, "unavailable", True
+
+        return task
+
+    task["version"] = versions[pkg_name][task["year"]]
 
-def get_checkpoint(json: dict) -> int:
+    if task["version"] is None:
+        print(f"Error processing {pkg_name}: no release is available")
+        task["statistics"] = "unavailable"
+    elif (pkg_name, task["version"]) in analyzed:
+        task["statistics"] = analyzed[(pkg_name, task["version"])]
+
+    return task
+
+def fetch_stage(task: dict, fetcher: PackageFetcher) -> dict:
     """
-    Restore the index of the last analyzed package in order to have a checkpoint mechanism
+    Artifact fetch: the wheel of the version (or its source distribution) is brought into the artifact store.
 
-    :json: dictionary containing the statistics gathered so far
-    :return: index of the last package that has been analyzed
+    :param task: package to analyze
+    :param fetcher: package fetcher
+    :return: task with "artifact": ("wheel", path), ("sdist", path) or ("requirement", pip requirement)
     """
-    return len(json.keys())
+    if "statistics" in task:
+        return task
 
-if __name__ == "__main__":
-    for json_file in os.listdir(PKGS_DATA_DIR):
-        statistics = {}# dictionary to store the gathered statistics for each package under analysis
-        start_idx = 0
-        analyzed_pkgs_count = 0
-        year = int(json_file.split("_")[-1][: -5])
+    pkg_name, version = task["package"], task["version"]
+
+    try:
+        if (wheel := fetcher.get_wheel(pkg_name, version)) is not None:
+            task["artifact"] = ("wheel", fetcher.fetch(pkg_name, version, wheel))
+        elif (sdist := fetcher.get_sdist(pkg_name, version)) is not None:
+            task["artifact"] = ("sdist", os.path.abspath(fetcher.fetch(pkg_name, version, sdist)))
+        elif get_pypi_client().is_offline():
+            raise ConnectionError(f"{pkg_name}=={version} has no distribution file available offline")
+        else:
+            # (we use <= just in case the version, for some reason, is not available)
+            task["artifact"] = ("requirement", f"{pkg_name}<={version}")
+    except Exception as e:
+        print(f"Error processing {pkg_name}: {e}")
+        task["statistics"] = "unavailable"
+
+    return task
 
-        if os.path.exists(f"{RESULT_PATH_DIR}/{json_file}"):
-            statistics = json.load(open(f"{RESULT_PATH_DIR}/{json_file}"))
-            start_idx = get_checkpoint(statistics)
-            analyzed_pkgs_count = start_idx
+def extract_stage(task: dict, fetcher: PackageFetcher) -> dict:
+    """
+    Extraction: the python files of the package are read in memory, from the wheel or from the tree installed by pip
+    (removed right after reading it, so temporary trees never outnumber the extraction workers).
+
+    :param task: package to analyze
+    :param fetcher: package fetcher
+    :return: task with "sources": list of (relative path of the file, content of the file, path of the file for reporting)
+    """
+    if "statistics" in task:
+        return task
 
-        df_pkgs = pd.read_json(f"{PKGS_DATA_DIR}/{json_file}")[0][start_idx:]
+    pkg_name = task["package"]
+    kind, artifact = task.pop("artifact")
 
+    if kind == "wheel":
         try:
-            for pkg_name in tqdm(df_pkgs, desc=f"Packages analysis({json_file})"):
-                try:
-                    local_import = []
-                    inner_function = []
-                    total_scopes = 0
-                    download_path = os.path.join(TEMP_DIR, pkg_name)
-                    version = get_version(year, pkg_name)
-
-                    # downloading package (we use <= just in case the version, for some reason, is not available)
-                    #os.system(f"pip3 install -t {download_path} -q --no-deps --no-cache-dir '{pkg_name}<={version}'")
-                    subprocess.run(
-                        [sys.executable, "-m", "pip", "install",
-                         "-t", download_path,
-                         "-q",
-                         "--no-deps",
-                         "--no-cache-dir",
-                         f"{pkg_name}<={version}"],
-                        check=False  # don't raise on failure, your existing try/except handles it
-                    )
-
-                    for py_file in pathlib.Path(download_path).glob("**/*.py"): # takes only python files in all possible directories
-                        try:
-                            detector = Detector(f"{py_file}", heuristic_path=HEURISTICS_DIR)
-                            shadowing, yara = detector.shadowing_detection()
-
-                            yara_rule_names = [rule.rule for rule in yara] # list contains the names of the yara rules
-
-                            if detector.get_builder() is not None:
-                                # features extraction
-                                local_import = detector.local_import_detection()
-                                inner_function, scopes_number = detector.inner_function_detection()
-                                scope_chain_length = detector.get_builder().length_longest_scope_chain()
-                                total_scopes += scopes_number
-                        except Exception as e:
-                            print(f"Error processing file {py_file}: {e}")
-                            continue
-
-                    statistics[pkg_name] = {"local_import": local_import,
-                                            "inner_function": inner_function,
-                                            "number_of_scopes": total_scopes,
-                                            "scope_chain_length": scope_chain_length,
-                                            "shadowing": "true" if len(shadowing) > 0 or len(yara) > 0 else "false",
-                                            "patch_decorator_import": "true" if "patch_decorator_import" in yara_rule_names else "false",
-                                            "patch_decorator_usage": "true" if "patch_decorator_usage" in yara_rule_names else "false",
-                                            "contextmanager_import": "true" if "contextmanager_import" in yara_rule_names else "false",
-                                            "contextmanager_usage": "true" if "contextmanager_usage" in yara_rule_names else "false",
-                                            "with_statement": "true" if "with_statement" in yara_rule_names else "false",
-                                            "overwrite_method_class": "true" if "overwrite_method_class" in yara_rule_names else "false"}
-
-                    analyzed_pkgs_count += 1
-
-                    if analyzed_pkgs_count % SAVE_FREQUENCY == 0:
-                        json.dump(statistics, open(f"{RESULT_PATH_DIR}/{json_file}", "w"), indent=4)
-
-                    # removing temp directory, even if isn't empty
-                    shutil.rmtree(download_path, ignore_errors=True)
-                except Exception as e:
-                    print(f"Error processing {pkg_name}: {e}")
-                    statistics[pkg_name] = "unavailable"
-                    continue
+            task["sources"] = [(name, raw, f"{os.path.basename(artifact)}/{name}") for name, raw in fetcher.iter_archive_sources(artifact)]
         except Exception as e:
-            json.dump(statistics, open(f"{RESULT_PATH_DIR}/{json_file}", "w"), indent=4)
-        finally:
-            json.dump(statistics, open(f"{RESULT_PATH_DIR}/{json_file}", "w"), indent=4)
\ No newline at end of file
+            print(f"Error processing {pkg_name}: {e}")
+            task["statistics"] = "unavailable"
+
+        return task
+
+    download_path = os.path.join(TEMP_DIR, pkg_name)
+
+    try:
+        subprocess.run(
+            [sys.executable, "-m", "pip", "install",
+             "-t", download_path,
+             "-q",
+             "--no-deps",
+             "--no-cache-dir",
+             *(["--no-index", "--no-build-isolation"] if get_pypi_client().is_offline() else []),
+             artifact],
+            check=False  # don't raise on failure, the missing directory is handled below
+        )
+
+        if not os.path.isdir(download_path):
+            raise FileNotFoundError(f"{artifact} can't be downloaded")
+
+        task["sources"] = [(str(py_file.relative_to(download_path)), py_file.read_bytes(), str(py_file))
+                           for py_file in sorted(pathlib.Path(download_path).glob("**/*.py"))] # takes only python files in all possible directories
+    except Exception as e:
+        print(f"Error processing {pkg_name}: {e}")
+        task["statistics"] = "unavailable"
+    finally:
+        # removing temp directory, even if isn't empty
+        shutil.rmtree(download_path, ignore_errors=True)
+
+    return task
+
+def scan_stage(task: dict, scan_workers: threading.local, all_scan_workers: list[ScanWorker]) -> dict:
+    """
+    Scan: each file is analyzed in a scanner process (one for each thread of the stage) that is killed and replaced if
+    it exceeds the budget, and its result is folded into the package statistics.
+
+    :param task: package to analyze
+    :param scan_workers: scanner of each thread
+    :param all_scan_workers: all the scanners, to close them at the end
+    :return: task with "statistics"
+    """
+    if "statistics" in task:
+        return task
+
+    summary = PackageSummary() # file results are folded into the package statistics as they complete
+
+    try:
+        if not hasattr(scan_workers, "worker"):
+            scan_workers.worker = ScanWorker(HEURISTICS_DIR, timeout=FILE_TIMEOUT_SECONDS, memory_limit=FILE_MEMORY_LIMIT, result_cache_dir=RESULT_CACHE_DIR,
+                                             start_method=SCAN_START_METHOD)
+            all_scan_workers.append(scan_workers.worker)
+
+        for relative_path, raw, code_path in task.pop("sources"):
+            result = scan_workers.worker.scan(code_path, raw)
+
+            if result["status"] in ("timeout", "oom"):
+                summary.add_skipped(relative_path, result["status"])
+            elif result["status"] == "ok":
+                summary.add(result, relative_path)
+            else:
+                print(f"Error processing file {code_path}: {result.get('reason', result['status'])}")
+    except Exception as e:
+        # e.g., the scanner can't be started: the package gets a record anyway, a failed item would never reach the
+        # write stage
+        print(f"Error processing {task['package']}: {e}")
+        task["statistics"] = "unavailable"
+
+        return task
+
+    task["statistics"] = summary.get_statistics()
+
+    return task
+
+def write_stage(task: dict, results_log: ResultsLog, analyzed: dict, progress_bar: tqdm) -> None:
+    """
+    Result write: the statistics of the package are logged and, if available, stored for the other years. A package
+    to retry (see resolve_stage) is not logged, so it isn't considered done.
+
+    :param task: analyzed package
+    :param results_log: results log of the year
+    :param analyzed: (package, version) -> statistics, shared by the yearly runs
+    :param progress_bar: progress bar of the year
+    """
+    if not task.get("retry", False):
+        results_log.append(task["package"], task["statistics"], task["version"])
+
+    # unavailable packages are not stored, the failure can be temporary
+    if task["version"] is not None and not task["statistics"] == "unavailable":
+        analyzed[(task["package"], task["version"])] = task["statistics"]
+
+    progress_bar.update()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect shadowing in the top packages of each year")
+    parser.add_argument("--offline", action="store_true", help="serve metadata and packages only from the local caches")
+    args = parser.parse_args()
+
+    set_offline(args.offline)
+
+    logs = {} # json file -> (results log, packages of the list)
+
+    for json_file in os.listdir(PKGS_DATA_DIR):
+        result_path = f"{RESULT_PATH_DIR}/{json_file}"
+        # a per-year JSON of a run without the log is not imported: its statistics come from an older aggregation
+        # (see STATISTICS_VERSION), so its packages are analyzed again
+        results_log = ResultsLog(f"{result_path[: -5]}.jsonl")
+        logs[json_file] = (results_log, list(pd.read_json(f"{PKGS_DATA_DIR}/{json_file}")[0]))
+
+    years = [int(json_file.split("_")[-1][: -5]) for json_file in logs.keys()]
+    # the versions of all the years are resolved at once: the metadata of each package are fetched and swept only one time
+    versions = {}
+    # (package, version) -> statistics: a version already analyzed for another year (even in a previous run) is not downloaded again
+    analyzed = {(pkg_name, version): pkg_statistics for results_log, _ in logs.values()
+                for pkg_name, version, pkg_statistics in results_log.iter_records()
+                if version is not None and not pkg_statistics == "unavailable"}
+    fetcher = PackageFetcher(ArtifactStore(get_pypi_client(), ARTIFACT_STORE_DIR))
+    scan_workers = threading.local()
+    all_scan_workers = []
+
+    try:
+        for json_file, (results_log, pkgs) in logs.items():
+            year = int(json_file.split("_")[-1][: -5])
+            todo = [pkg_name for pkg_name in pkgs if pkg_name not in results_log.get_done()] # resume: packages not in the log
+
+            try:
+                # stages connected by bounded queues: downloads and scans overlap, while the packages in flight stay bounded
+                with tqdm(total=len(todo), desc=f"Packages analysis({json_file})") as progress_bar:
+                    (Pipeline()
+                     .add_stage("resolve", lambda task: resolve_stage(task, years, versions, analyzed), RESOLVE_WORKERS, QUEUE_SIZE)
+                     .add_stage("fetch", lambda task: fetch_stage(task, fetcher), FETCH_WORKERS, QUEUE_SIZE)
+                     .add_stage("extract", lambda task: extract_stage(task, fetcher), EXTRACT_WORKERS, QUEUE_SIZE)
+                     .add_stage("scan", lambda task: scan_stage(task, scan_workers, all_scan_workers), SCAN_WORKERS, QUEUE_SIZE)
+                     .add_stage("write", lambda task: write_stage(task, results_log, analyzed, progress_bar), 1, QUEUE_SIZE)
+                     .run({"package": pkg_name, "year": year} for pkg_name in todo))
+            except Exception as e:
+                print(f"Error analyzing {json_file}: {e}")
+            finally:
+                results_log.close()
+
+                # the per-year JSON follows the order of the list
+                results_log.compact(pkgs, f"{RESULT_PATH_DIR}/{json_file}")
+    finally:
+        for scan_worker in all_scan_workers:
+            scan_worker.close()
@@ -12,6 +12,8 @@ PACKAGE_LIST_PATH = "../../data/top packages/top50000_2025.json"
 FILE_NAME = "samples.json"
 SAVE_FREQUENCY = 10 # how many packages will be analyzed before saving the results
 UNTIL = "2025-12-31"
+LINE_TRACKER = "lhdiff" # line tracker following the shadowing lines across commits: "lhdiff" (external tool) or "native"
+INCREMENTAL = True # analyze each version of a file visiting only the top-level statements changed by the commit
 
 def get_checkpoint(json: dict) -> int:
     """
@@ -43,7 +45,7 @@ if __name__ == "__main__":
         package_history[pkg_name] = {}
 
         try:
-            package_history[pkg_name] = PackageShadowingHistory(pkg_name, "../classes/heuristics").get_package_history(UNTIL)
+            package_history[pkg_name] = PackageShadowingHistory(pkg_name, "../classes/heuristics", LINE_TRACKER, INCREMENTAL).get_package_history(UNTIL)
 
             if pkg_count % SAVE_FREQUENCY == 0:
                 json.dump(package_history, open(f"{HISTORY_OUTPUT_DIR}/{FILE_NAME}", "w"), indent=4)
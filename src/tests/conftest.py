@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the tests import the modules as the scripts do, from the src directory
+SRC_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEURISTICS_DIR: str = os.path.join(SRC_DIR, "classes", "heuristics")
+
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
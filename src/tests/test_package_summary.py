@@ -0,0 +1,36 @@
+from classes.package_summary import PackageSummary
+
+def make_result(local_import: list[str], inner_function: list[list[str]], number_of_scopes: int=1, scope_chain_length: int=1,
+                yara: list[dict] | None=None) -> dict:
+    return {"shadowing": [], "yara": yara or [], "local_import": local_import, "inner_function": inner_function,
+            "number_of_scopes": number_of_scopes, "scope_chain_length": scope_chain_length}
+
+def test_same_scope_names_in_different_files_are_kept():
+    summary = PackageSummary()
+    summary.add(make_result(["s3_func_f"], [["s1_func_g", "s3_func_f"]]), "pkg/a.py")
+    summary.add(make_result(["s3_func_f"], [["s1_func_g", "s3_func_f"]]), "pkg/b.py")
+
+    statistics = summary.get_statistics()
+
+    assert statistics["local_import"] == ["pkg/a.py:s3_func_f", "pkg/b.py:s3_func_f"]
+    assert statistics["inner_function"] == [["pkg/a.py:s1_func_g", "pkg/a.py:s3_func_f"], ["pkg/b.py:s1_func_g", "pkg/b.py:s3_func_f"]]
+
+def test_merge_is_the_same_of_a_sequential_summary():
+    results = [(make_result(["s1_func_f"], [], 3, 2, [{"name": "with_statement", "lines": [1]}]), "a.py"),
+               (make_result([], [["s1_func_g", "s2_func_h"]], 5, 4), "b.py"),
+               (make_result(["s1_func_f"], [], 1, 1), "c.py")]
+    sequential, first, second = PackageSummary(), PackageSummary(), PackageSummary()
+
+    for result, relative_path in results:
+        sequential.add(result, relative_path)
+
+    first.add(*results[2])
+    second.add(*results[0])
+    second.add(*results[1])
+    first.merge(second)
+
+    assert first.get_statistics() == sequential.get_statistics()
+    assert sequential.get_statistics()["number_of_scopes"] == 9
+    assert sequential.get_statistics()["scope_chain_length"] == 4
+    assert sequential.get_statistics()["with_statement"] == "true"
+    assert sequential.get_statistics()["shadowing"] == "true"
@@ -0,0 +1,41 @@
+import pytest
+import requests
+
+from classes.pypi_client import PyPIClient
+
+class FakeResponse:
+    def __init__(self, status_code: int, payload: dict | None=None) -> None:
+        self.status_code = status_code
+        self.headers = {}
+        self.__payload = payload
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+    def json(self) -> dict:
+        return self.__payload
+
+def make_client(tmp_path, monkeypatch, response: FakeResponse) -> PyPIClient:
+    client = PyPIClient(cache_dir=str(tmp_path), requests_per_second=1000)
+    monkeypatch.setattr(requests.Session, "get", lambda *args, **kwargs: response)
+
+    return client
+
+def test_failed_request_raises_if_strict(tmp_path, monkeypatch):
+    client = make_client(tmp_path, monkeypatch, FakeResponse(503))
+
+    assert client.get_releases("pkg") == {}
+
+    with pytest.raises(ConnectionError):
+        client.get_releases("pkg", strict=True)
+
+def test_missing_package_has_no_releases(tmp_path, monkeypatch):
+    client = make_client(tmp_path, monkeypatch, FakeResponse(404))
+
+    assert client.get_releases("pkg", strict=True) == {}
+
+def test_releases(tmp_path, monkeypatch):
+    client = make_client(tmp_path, monkeypatch, FakeResponse(200, {"releases": {"1.0": []}}))
+
+    assert client.get_releases("pkg", strict=True) == {"1.0": []}
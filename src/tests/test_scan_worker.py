@@ -0,0 +1,30 @@
+import pytest
+
+from classes.scan_worker import ScanWorker, resource
+
+from conftest import HEURISTICS_DIR
+
+MEMORY_LIMIT: int = 300 * 1024 ** 2
+
+@pytest.fixture(autouse=True)
+def working_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # caches (e.g., compiled YARA rules) are written in the working directory
+
+@pytest.mark.skipif(resource is None, reason="the memory budget is not enforced on this platform")
+def test_over_budget_file_is_oom():
+    # parsing a huge literal exceeds the address space of the worker
+    raw = ("x = [" + "1, " * 2_000_000 + "]\n").encode()
+
+    with ScanWorker(HEURISTICS_DIR, timeout=120, memory_limit=MEMORY_LIMIT) as worker:
+        assert worker.scan("huge.py", raw)["status"] == "oom"
+
+        # the worker is replaced, the next file is analyzed
+        assert worker.scan("small.py", b"x = 1\n")["status"] == "ok"
+
+def test_parse_error_reports_the_reason():
+    with ScanWorker(HEURISTICS_DIR, timeout=120) as worker:
+        result = worker.scan("broken.py", b"def f(:\n")
+
+    assert result["status"] == "error"
+    assert result["reason"].startswith("Error parsing the code: ")
+    assert "NoneType" not in result["reason"]
@@ -1,53 +1,69 @@
-import requests
+import functools
+import os
+
+from collections.abc import Iterable
 
 from packaging.version import InvalidVersion, Version
 
+from classes.pypi_client import PyPIClient
+
 PYPI_API: str = "https://pypi.org/pypi/<package-name>/json"
 REQUEST_TIMEOUT_SECONDS: int = 20
+PYPI_CACHE_DIR: str = "./cache/pypi" # persistent, the offline mode relies on it (./tmp is a scratch tree)
+PYPI_CACHE_TTL_SECONDS: int = 24 * 60 * 60 # cached releases are revalidated after one day
+YEARS: range = range(2016, 2026) # years of the top packages lists
 
-def get_pypi_releases(pkg: str) -> dict:
-    """
-    Retrieve all PyPI releases for a package.
+_pypi_client: PyPIClient | None = None
+_pypi_client_pid: int | None = None
+_pypi_offline: bool = False
 
-    Results are cached so the same package is not downloaded repeatedly.
+def get_pypi_client() -> PyPIClient:
     """
-    url = PYPI_API.replace("<package-name>", pkg)
+    :return: PyPI client shared by the process, created at the first call
+    """
+    global _pypi_client, _pypi_client_pid
 
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        payload = response.json()
-    except requests.RequestException as e:
-        print(f"PyPI request error for {pkg}: {e}")
-        return {}
-    except ValueError as e:
-        print(f"Invalid JSON from PyPI for {pkg}: {e}")
-        return {}
+    # a forked process (e.g., a pool worker) must not share the connections of its parent
+    if _pypi_client is None or not _pypi_client_pid == os.getpid():
+        _pypi_client = PyPIClient(api_url=PYPI_API, cache_dir=PYPI_CACHE_DIR, ttl=PYPI_CACHE_TTL_SECONDS, timeout=REQUEST_TIMEOUT_SECONDS,
+                                  offline=_pypi_offline)
+        _pypi_client_pid = os.getpid()
 
-    releases = payload.get("releases", {})
+    return _pypi_client
 
-    if not isinstance(releases, dict):
-        return {}
+def set_offline(offline: bool) -> None:
+    """
+    Enable (or disable) the offline mode: metadata and artifacts are served only from the local caches. The setting is
+    inherited by the processes forked afterwards.
 
-    return releases
+    :offline: True to enable the offline mode
+    """
+    global _pypi_client, _pypi_offline
 
+    _pypi_offline = offline
+    _pypi_client = None # the next client is created with the new setting
 
-def get_version(year: int, pkg: str) -> str | None:
+def get_pypi_releases(pkg: str) -> dict:
     """
-    Get the latest package version released in or before a given year.
+    Retrieve all PyPI releases for a package.
 
-    :year: year of interest
-    :pkg: package name
-    :return: version of the package for the given year, or None if no valid release exists
+    Results are cached so the same package is not downloaded repeatedly.
     """
-    releases = get_pypi_releases(pkg)
+    return get_pypi_client().get_releases(pkg)
 
-    if not releases:
-        return None
 
-    best_version: str | None = None
+def resolve_versions(releases: dict, years: Iterable[int]=YEARS) -> dict[int, str | None]:
+    """
+    Get the latest version released in or before each year, with a single sweep over the releases sorted by the year
+    of their first upload.
 
-    for version, release_files in releases.items():
+    :releases: releases of the package (version -> list of the release files), as returned by get_pypi_releases
+    :years: years of interest
+    :return: dictionary year -> version of the package for the given year, or None if no valid release exists
+    """
+    dated_releases = [] # (first upload year, parsed version, position, version)
+
+    for position, (version, release_files) in enumerate(releases.items()):
         if not release_files:
             continue
 
@@ -71,12 +87,62 @@ def get_version(year: int, pkg: str) -> str | None:
         if not upload_years:
             continue
 
-        first_upload_year = min(upload_years)
+        dated_releases.append((min(upload_years), parsed_version, position, version))
 
-        if first_upload_year > year:
-            continue
+    dated_releases.sort(key=lambda release: release[0])
+
+    versions = {}
+    best = None # (parsed version, -position, version) of the latest version so far
+    idx = 0
+
+    for year in sorted(years):
+        while idx < len(dated_releases) and dated_releases[idx][0] <= year:
+            _, parsed_version, position, version = dated_releases[idx]
 
-        if best_version is None or parsed_version > Version(best_version):
-            best_version = version
+            # among equal versions (e.g., 1.0 and 1.0.0) the first one listed is kept
+            if best is None or (parsed_version, -position) > best[: 2]:
+                best = (parsed_version, -position, version)
+
+            idx += 1
+
+        versions[year] = best[2] if best is not None else None
+
+    return versions
+
+def resolve_packages(pkgs: list[str], years: Iterable[int]=YEARS) -> dict[str, dict[int, str | None]]:
+    """
+    Get the versions of many packages for each year. The metadata of the packages are fetched concurrently, then each
+    package is resolved with one sweep.
+
+    :pkgs: package names
+    :years: years of interest
+    :return: dictionary package -> year -> version of the package for the given year
+    """
+    years = list(years)
+    get_pypi_client().prefetch(pkgs)
+
+    return {pkg: resolve_versions(get_pypi_releases(pkg), years) for pkg in dict.fromkeys(pkgs)}
+
+@functools.lru_cache(maxsize=4096)
+def get_versions(pkg: str) -> dict[int, str | None]:
+    """
+    Get the versions of the package for each year in YEARS. Results are memoized, so the yearly runs resolve a package
+    only once.
+
+    :pkg: package name
+    :return: dictionary year -> version of the package for the given year
+    """
+    return resolve_versions(get_pypi_releases(pkg))
+
+def get_version(year: int, pkg: str) -> str | None:
+    """
+    Get the latest package version released in or before a given year.
+
+    :year: year of interest
+    :pkg: package name
+    :return: version of the package for the given year, or None if no valid release exists
+    """
+    if year in YEARS:
+        return get_versions(pkg)[year]
 
-    return best_version
+    return resolve_versions(get_pypi_releases(pkg), [year])[year]